@@ -0,0 +1,9 @@
+import pytest
+
+from core.testing import temporary_cache
+
+
+@pytest.fixture(autouse=True, scope='session')
+def isolated_cache():
+    with temporary_cache():
+        yield
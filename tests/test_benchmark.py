@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from posts import benchmark
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.django_db]
+
+SIZES = (200, 1000)
+VIEWS = ('index', 'group_posts', 'profile', 'post_detail', 'follow_index')
+
+
+class TestBenchmark:
+
+    def test_views_benchmark(self, capsys):
+        report = benchmark.measure_views(SIZES, requests=5, cold=True)
+        with capsys.disabled():
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        for size in SIZES:
+            for view in VIEWS:
+                assert {'p50', 'p95', 'queries'} <= set(report[size][view]), (
+                    f'Нет замеров `{view}` на {size} постах'
+                )
+        small, large = (report[size] for size in SIZES)
+        for view in VIEWS:
+            assert large[view]['queries'] <= small[view]['queries'], (
+                f'Число запросов `{view}` растёт вместе с объёмом данных'
+            )
@@ -0,0 +1,59 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'version:{}'
+
+
+def initial_version():
+    # Если счётчик вытеснен из кеша, новая версия не должна совпасть
+    # со старой, иначе снова станут видны устаревшие фрагменты.
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """Текущая версия набора данных для ключей фрагментного кеша."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        version = initial_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    """Инвалидирует все фрагменты, ключ которых содержит версию name."""
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = initial_version()
+        cache.set(key, version, None)
+        return version
+
+
+MODIFIED_KEY = 'modified:{}'
+
+
+def touch(*names):
+    """Отмечает, что данные names изменились сейчас."""
+    now = time.time()
+    cache.set_many({MODIFIED_KEY.format(name): now for name in names}, None)
+
+
+def get_modified(*names):
+    """Время последнего изменения каждого из names, timestamp.
+
+    Отсутствующая отметка (ещё не было изменений или ключ вытеснен)
+    считается изменением в текущий момент: клиент один раз получит
+    страницу целиком, но никогда - устаревший 304.
+    """
+    keys = {MODIFIED_KEY.format(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in found}
+    for key, value in missing.items():
+        if not cache.add(key, value, None):
+            value = cache.get(key, value)
+        found[key] = value
+    return {name: found[key] for key, name in keys.items()}
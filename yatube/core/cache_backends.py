@@ -0,0 +1,341 @@
+"""Кеш-бэкенды, общие для всех процессов сервера и не требующие сети.
+
+``SQLiteCache`` хранит значения в одном файле SQLite: его видят все
+воркеры gunicorn, и он переживает перезапуск. ``TieredCache`` ставит
+перед ним маленький LRU-кеш в памяти процесса, чтобы горячие ключи не
+ходили даже в файл.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL
+)
+'''
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite (LOCATION) в режиме WAL."""
+
+    cull_every = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self.local = threading.local()
+        self.writes = 0
+
+    @property
+    def connection(self):
+        # Соединение своё у каждого потока и у каждого дочернего процесса.
+        pid = os.getpid()
+        if getattr(self.local, 'pid', None) != pid:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None,
+                check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            self.local.connection = connection
+            self.local.pid = pid
+        return self.local.connection
+
+    def execute(self, sql, params=()):
+        return self.connection.execute(sql, params)
+
+    @contextmanager
+    def transaction(self, mode=''):
+        connection = self.connection
+        connection.execute(f'BEGIN {mode}')
+        try:
+            yield connection
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def encode(self, value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def get_many_raw(self, keys):
+        now = time.time()
+        found = {}
+        keys = list(keys)
+        # SQLite ограничивает число параметров запроса.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.execute(
+                f'SELECT key, value, expires FROM cache '
+                f'WHERE key IN ({placeholders})',
+                chunk,
+            )
+            for key, value, expires in rows:
+                if expires is None or expires > now:
+                    found[key] = pickle.loads(value)
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.get_many_raw([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version=version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        found = self.get_many_raw(made)
+        return {made[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, self.encode(value), self.get_backend_timeout(timeout)),
+        )
+        self.maybe_cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, self.encode(value), expires))
+        with self.transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                rows,
+            )
+        self.maybe_cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self.transaction('IMMEDIATE') as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            cursor = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, self.encode(value), self.get_backend_timeout(timeout)),
+            )
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self.execute(
+            'UPDATE cache SET expires = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        made = self.make_key(key, version=version)
+        self.validate_key(made)
+        # BEGIN IMMEDIATE сериализует инкременты между процессами.
+        with self.transaction('IMMEDIATE') as connection:
+            value = self.get_many_raw([made]).get(made)
+            if value is None:
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (self.encode(value), made),
+            )
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version=version) for key in keys]
+        with self.transaction() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in made]
+            )
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self.execute('DELETE FROM cache')
+
+    def maybe_cull(self):
+        self.writes += 1
+        if self.writes % self.cull_every:
+            return
+        self.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count, = self.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            excess = count - self._max_entries
+            excess += self._max_entries // self._cull_frequency
+            self.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (excess,),
+            )
+
+    def close(self, **kwargs):
+        # Соединение держится между запросами, как CONN_MAX_AGE у БД.
+        pass
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кеш: LRU процесса перед общим бэкендом.
+
+    OPTIONS:
+        SHARED - alias общего кеша из ``CACHES``;
+        LOCAL_MAX_ENTRIES - размер LRU в памяти процесса;
+        LOCAL_TIMEOUT - сколько секунд ключ живёт в LRU. Это верхняя
+        граница того, насколько процесс может отстать от записи,
+        сделанной другим процессом.
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self.local_timeout = float(options.get('LOCAL_TIMEOUT', 5))
+        super().__init__(params)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def local_get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            pickled, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+        return True, pickle.loads(pickled)
+
+    def local_set(self, key, value):
+        # Копия через pickle, как в LocMemCache: изменение полученного
+        # объекта не должно менять закешированное значение.
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = time.monotonic() + self.local_timeout
+        with self.lock:
+            self.entries[key] = (pickled, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.local_max_entries:
+                self.entries.popitem(last=False)
+
+    def local_delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_key(key, version=version)
+        hit, value = self.local_get(local_key)
+        if hit:
+            metrics.record_cache(hits=1)
+            return value
+        missing = object()
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            metrics.record_cache(misses=1)
+            return default
+        metrics.record_cache(hits=1)
+        self.local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = {}
+        remote = []
+        for key in keys:
+            hit, value = self.local_get(self.make_key(key, version=version))
+            if hit:
+                found[key] = value
+            else:
+                remote.append(key)
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                self.local_set(self.make_key(key, version=version), value)
+            found.update(fetched)
+        metrics.record_cache(
+            hits=len(found), misses=len(keys) - len(found)
+        )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self.local_set(self.make_key(key, version=version), value)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            self.local_set(self.make_key(key, version=version), value)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self.local_set(self.make_key(key, version=version), value)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self.local_set(self.make_key(key, version=version), value)
+        return value
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self.local_delete(self.make_key(key, version=version))
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        self.local_delete(*(self.make_key(key, version=version)
+                            for key in keys))
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version=version) is not self
+
+    def clear(self):
+        self.shared.clear()
+        with self.lock:
+            self.entries.clear()
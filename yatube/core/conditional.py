@@ -0,0 +1,74 @@
+"""Условные GET-запросы: ETag и Last-Modified без рендеринга страницы.
+
+Представление описывает, от каких данных зависит страница, списком
+имён вроде ``post:1``. Сигналы вызывают ``core.cache.touch`` для этих
+имён при каждом изменении, а декоратор сравнивает отметки времени с
+заголовками клиента и отвечает ``304`` до запросов и шаблонов.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .cache import get_modified
+
+# Меняется при выкладке, если поменялись шаблоны.
+SALT = getattr(settings, 'CONDITIONAL_GET_SALT', '')
+
+
+def page_modified(request, depends_on, kwargs):
+    """Отметки изменения данных страницы или None, если объекта нет.
+
+    Считаются один раз на запрос: их используют и условный GET, и кеш
+    страниц.
+    """
+    if not hasattr(request, '_page_modified'):
+        names = depends_on(request, **kwargs)
+        request._page_modified = names and get_modified(*names)
+    return request._page_modified
+
+
+def validators(request, depends_on, kwargs):
+    """ETag и Last-Modified страницы."""
+    modified = page_modified(request, depends_on, kwargs)
+    if not modified:
+        return None, None
+    return (
+        make_etag(request, modified),
+        datetime.fromtimestamp(max(modified.values()), timezone.utc),
+    )
+
+
+def make_etag(request, modified):
+    # Страница зависит и от зрителя: шапка, кнопка подписки, форма
+    # комментария с CSRF-токеном.
+    parts = [
+        SALT,
+        str(request.user.pk),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *(f'{name}={value}' for name, value in sorted(modified.items())),
+    ]
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def conditional_page(depends_on):
+    """Декоратор представления с условным GET.
+
+    depends_on(request, **kwargs) возвращает имена данных страницы или
+    None, если объекта нет: тогда представление само ответит 404.
+    """
+    def etag(request, *args, **kwargs):
+        return validators(request, depends_on, kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validators(request, depends_on, kwargs)[1]
+
+    def decorator(view):
+        view = condition(etag_func=etag, last_modified_func=last_modified)(
+            view
+        )
+        # Браузер хранит страницу, но каждый раз её перепроверяет.
+        return cache_control(private=True, no_cache=True)(view)
+    return decorator
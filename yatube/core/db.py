@@ -0,0 +1,54 @@
+"""Настройка соединений SQLite.
+
+``configure_connection`` подключён к сигналу ``connection_created`` и
+выполняет ``PRAGMA`` из настройки ``SQLITE_PRAGMAS`` на каждом новом
+соединении. В профиле production это журнал WAL (читатели не ждут
+писателя, писатель - читателей), кеш страниц, mmap и ожидание
+блокировки вместо немедленной ошибки «database is locked».
+
+``backup`` копирует основную базу в файл реплики для локального
+запуска с репликами (``manage.py sync_replica``).
+"""
+import sqlite3
+from contextlib import closing
+
+from django.conf import settings
+from django.db import connections
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def close_connections():
+    """Закрывает соединения перед fork и в начале дочернего процесса.
+
+    Соединения родителя нельзя делить с дочерними процессами: два
+    процесса на одном сокете или файловом дескрипторе ломают друг другу
+    транзакции. Годится как ``initializer`` для ``multiprocessing.Pool``.
+    """
+    connections.close_all()
+
+
+def pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+
+def backup(source, target, pages=-1):
+    """Копирует базу SQLite из файла source в файл target.
+
+    Backup API даёт согласованный снимок, даже пока в source пишут, а
+    открытые соединения с target видят новые данные без переподключения.
+    """
+    with closing(sqlite3.connect(source, timeout=30)) as source_db, \
+            closing(sqlite3.connect(target, timeout=30)) as target_db:
+        source_db.backup(target_db, pages=pages)
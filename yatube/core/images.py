@@ -0,0 +1,143 @@
+"""Нормализация загруженных изображений.
+
+Загрузка пишется во временный файл на диске (``FILE_UPLOAD_HANDLERS``),
+а перед сохранением в хранилище изображение уменьшается до
+IMAGE_MAX_SIZE по большей стороне, поворачивается по EXIF и
+перекодируется без метаданных: JPEG для непрозрачных картинок, PNG -
+для картинок с прозрачностью. Небольшие файлы в веб-формате без EXIF
+и анимированные GIF сохраняются как есть; анимацию больше IMAGE_MAX_SIZE
+или тяжелее IMAGE_MAX_ANIMATED_BYTES валидатор поля не пропускает.
+
+Размеры и вес файла записываются в модель, поэтому ни вёрстке, ни
+генерации миниатюр не нужно открывать исходник, чтобы их узнать. Туда
+же пишется превью PLACEHOLDER_SIZE пикселей в виде data: URI: шаблон
+показывает его фоном, пока грузится миниатюра.
+"""
+import base64
+import io
+import os
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+MAX_SIZE = getattr(settings, 'IMAGE_MAX_SIZE', 2048)
+# Файлы тяжелее перекодируются, даже если размеры в пределах нормы.
+MAX_BYTES = getattr(settings, 'IMAGE_MAX_BYTES', 512 * 1024)
+QUALITY = getattr(settings, 'IMAGE_QUALITY', 85)
+# Анимацию не перекодируем, поэтому её просто ограничиваем.
+MAX_ANIMATED_BYTES = getattr(
+    settings, 'IMAGE_MAX_ANIMATED_BYTES', 4 * 1024 * 1024
+)
+WEB_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+# PNG 16x16 меньше JPEG того же размера: у JPEG одни таблицы - 600 байт.
+PLACEHOLDER_SIZE = getattr(settings, 'IMAGE_PLACEHOLDER_SIZE', 16)
+
+Normalized = namedtuple('Normalized', 'file width height size placeholder')
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+
+
+def is_animated(image):
+    return getattr(image, 'n_frames', 1) > 1
+
+
+def needs_encoding(image, size):
+    if is_animated(image):
+        return False
+    return (
+        image.format not in WEB_FORMATS
+        or max(image.size) > MAX_SIZE
+        or size > MAX_BYTES
+        or bool(image.getexif())
+    )
+
+
+def validate_animation(file):
+    """Валидатор поля: анимация в пределах размеров и веса."""
+    if not file or getattr(file, '_committed', False):
+        return
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            too_large = is_animated(image) and (
+                max(image.size) > MAX_SIZE or file.size > MAX_ANIMATED_BYTES
+            )
+    except OSError:
+        # Не картинка: об этом скажет валидатор ImageField.
+        return
+    finally:
+        file.seek(0)
+    if too_large:
+        raise ValidationError(
+            'Анимация должна быть не больше %(pixels)s пикселей по '
+            'большей стороне и %(megabytes)s МБ.',
+            code='animation_too_large',
+            params={
+                'pixels': MAX_SIZE,
+                'megabytes': MAX_ANIMATED_BYTES // (1024 * 1024),
+            },
+        )
+
+
+def placeholder(image):
+    """Крошечное превью изображения как data: URI."""
+    preview = image.convert('RGB')
+    preview.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.BILINEAR)
+    output = io.BytesIO()
+    preview.save(output, 'PNG', optimize=True)
+    data = base64.b64encode(output.getvalue()).decode()
+    return 'data:image/png;base64,' + data
+
+
+def read_placeholder(file):
+    """Превью уже сохранённого файла, для дозаполнения старых постов."""
+    with Image.open(file) as image:
+        # JPEG декодируется сразу в 1/8 масштаба.
+        image.draft('RGB', (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+        return placeholder(ImageOps.exif_transpose(image))
+
+
+def encode(image):
+    """Перекодированное изображение: (байты, расширение, размеры, превью)."""
+    # draft() декодирует JPEG сразу в уменьшенном масштабе, не
+    # раскладывая в памяти все пиксели фотографии.
+    image.draft('RGB', (MAX_SIZE, MAX_SIZE))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_SIZE, MAX_SIZE), Image.LANCZOS)
+    output = io.BytesIO()
+    if has_alpha(image):
+        image.convert('RGBA').save(output, 'PNG', optimize=True)
+        extension = '.png'
+    else:
+        image.convert('RGB').save(
+            output, 'JPEG', quality=QUALITY, optimize=True,
+            progressive=True,
+        )
+        extension = '.jpg'
+    return output.getvalue(), extension, image.size, placeholder(image)
+
+
+def normalize(file):
+    """Нормализует загруженный файл; возвращает ``Normalized``.
+
+    file - новый, ещё не сохранённый файл поля ``ImageField``.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        if not needs_encoding(image, file.size):
+            width, height = image.size
+            preview = placeholder(image)
+            file.seek(0)
+            return Normalized(file, width, height, file.size, preview)
+        data, extension, (width, height), preview = encode(image)
+    name = os.path.splitext(os.path.basename(file.name))[0] + extension
+    return Normalized(
+        ContentFile(data, name=name), width, height, len(data), preview
+    )
@@ -0,0 +1,56 @@
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from core import thumbnails
+from core.db import close_connections
+
+
+class Command(BaseCommand):
+    help = 'Генерирует миниатюры из очереди ThumbnailJob'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Размер пула процессов для генерации',
+        )
+        parser.add_argument(
+            '--batch', type=int, default=100,
+            help='Сколько задач забирать из очереди за раз',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Не завершаться, а ждать новых задач',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Пауза между опросами очереди в режиме --loop',
+        )
+
+    def handle(self, *args, **options):
+        pool = None
+        if options['processes'] > 1:
+            close_connections()
+            pool = Pool(options['processes'], initializer=close_connections)
+        processed = 0
+        try:
+            while True:
+                jobs = thumbnails.pending_jobs(options['batch'])
+                if not jobs:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                if pool is None:
+                    for job_id in jobs:
+                        thumbnails.process(job_id)
+                else:
+                    pool.map(thumbnails.process, jobs)
+                processed += len(jobs)
+                self.stdout.write(f'Обработано задач: {processed}')
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.stdout.write(self.style.SUCCESS('Очередь миниатюр пуста'))
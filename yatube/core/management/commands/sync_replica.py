@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import db
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик DATABASE_REPLICAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Не завершаться, а повторять копирование',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='Пауза между копированиями в режиме --loop; должна быть '
+                 'меньше REPLICA_STICKY_SECONDS',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError(
+                'Реплики не настроены: задайте переменную DATABASE_REPLICA'
+            )
+        source = connections['default'].settings_dict['NAME']
+        while True:
+            for alias in settings.DATABASE_REPLICAS:
+                started = time.monotonic()
+                db.backup(source, connections[alias].settings_dict['NAME'])
+                elapsed = (time.monotonic() - started) * 1000
+                self.stdout.write(f'{alias}: скопировано за {elapsed:.0f} мс')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
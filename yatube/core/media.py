@@ -0,0 +1,185 @@
+"""Раздача загруженных файлов из MEDIA_ROOT.
+
+Картинки постов названы по хешу содержимого (``core.storage``), а имена
+миниатюр sorl-thumbnail - по хешу источника и параметров, поэтому такие
+файлы никогда не меняются и кешируются навсегда с ``immutable``.
+Остальные файлы кешируются на MEDIA_MAX_AGE и перепроверяются по ETag.
+
+Условный GET отвечает ``304`` по ``stat()`` без открытия файла. Сам файл
+по возможности отдаёт фронтенд-сервер: с MEDIA_ACCEL_REDIRECT - nginx
+через ``X-Accel-Redirect`` во внутренний location, с MEDIA_SENDFILE -
+Apache или lighttpd через ``X-Sendfile``. Иначе файл, или один диапазон
+из ``Range``, отдаёт ``FileResponse``: под gunicorn или uWSGI
+``wsgi.file_wrapper`` передаёт его через ``sendfile()`` без копирования
+в процесс Python.
+"""
+import mimetypes
+import os
+import re
+import stat
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+IMMUTABLE_MAX_AGE = getattr(
+    settings, 'MEDIA_IMMUTABLE_MAX_AGE', 365 * 24 * 60 * 60
+)
+MAX_AGE = getattr(settings, 'MEDIA_MAX_AGE', 60 * 60)
+# Имя по хешу содержимого (posts/ab/ab...ef.jpg) или миниатюра.
+IMMUTABLE_NAME = re.compile(
+    r'^(?:[\w/-]+/(?P<digest>[0-9a-f]{64})\.\w+|cache/.+)$'
+)
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_stat(request, path):
+    """Полный путь и ``stat`` файла; считаются один раз на запрос."""
+    if not hasattr(request, '_media_stat'):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+            result = os.stat(full_path)
+        except (OSError, ValueError):
+            raise Http404('Файл не найден')
+        if not stat.S_ISREG(result.st_mode):
+            raise Http404('Файл не найден')
+        request._media_stat = full_path, result
+    return request._media_stat
+
+
+def media_etag(request, path):
+    match = IMMUTABLE_NAME.match(path)
+    if match and match.group('digest'):
+        return match.group('digest')
+    result = media_stat(request, path)[1]
+    return f'{result.st_mtime_ns:x}-{result.st_size:x}'
+
+
+def media_modified(request, path):
+    return datetime.fromtimestamp(
+        media_stat(request, path)[1].st_mtime, timezone.utc
+    )
+
+
+def parse_range(header, size):
+    """Диапазон (начало, конец включительно) или None - весь файл.
+
+    Несколько диапазонов и чужие единицы игнорируются: RFC 7233
+    разрешает ответить на них целым файлом. Диапазон за концом файла -
+    ValueError, на него отвечают ``416``.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-500: последние 500 байт.
+        if not int(end):
+            raise ValueError(header)
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        raise ValueError(header)
+    if start > end:
+        return None
+    return start, end
+
+
+class FileSlice:
+    """Диапазон открытого файла для ``FileResponse``.
+
+    read() не выходит за конец диапазона, а fileno() оставляет
+    ``wsgi.file_wrapper`` возможность отправить файл через sendfile():
+    он начинает с текущей позиции и берёт Content-Length байт.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def handoff(path, full_path, content_type):
+    """Ответ, который отдаст фронтенд-сервер, или None."""
+    prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', '')
+    if prefix:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = prefix + quote(path)
+        return response
+    if getattr(settings, 'MEDIA_SENDFILE', False):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+    return None
+
+
+def file_response(request, path):
+    full_path, result = media_stat(request, path)
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    response = handoff(path, full_path, content_type)
+    if response is not None:
+        # Range и условные запросы фронтенд обработает сам.
+        return response
+    size = result.st_size
+    header = request.META.get('HTTP_RANGE', '')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range.strip('"') != media_etag(request, path):
+        header = ''
+    try:
+        byte_range = parse_range(header, size) if header else None
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            FileSlice(file, start, end - start + 1),
+            status=206, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        size = end - start + 1
+    response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+conditional_file = condition(
+    etag_func=media_etag, last_modified_func=media_modified
+)(file_response)
+
+
+def serve(request, path):
+    response = conditional_file(request, path)
+    # Заголовки кеша нужны и ответу 304.
+    if IMMUTABLE_NAME.match(path):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, max_age=MAX_AGE)
+    return response
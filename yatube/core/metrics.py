@@ -0,0 +1,193 @@
+"""Метрики запросов: время, SQL, шаблоны и кеш.
+
+``MetricsMiddleware`` собирает для каждого запроса общее время, число и
+время SQL-запросов, время рендеринга шаблонов и попадания в кеш. Итог
+уходит в заголовок ``Server-Timing``, по желанию - в лог одной
+JSON-строкой, и в скользящее окно последних запросов каждого
+представления. Окно живёт в памяти процесса, его читает
+``/admin/metrics/``.
+"""
+import json
+import logging
+import statistics
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger(__name__)
+
+WINDOW = getattr(settings, 'METRICS_WINDOW', 1000)
+LOG = getattr(settings, 'METRICS_LOG', False)
+SERVER_TIMING = getattr(settings, 'METRICS_SERVER_TIMING', True)
+# Верхние границы корзин гистограммы в миллисекундах.
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+local = threading.local()
+
+
+class RequestMetrics:
+    __slots__ = (
+        'started', 'queries', 'db_time', 'template_time', 'template_depth',
+        'cache_hits', 'cache_misses',
+    )
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def as_dict(self):
+        return {
+            'total_ms': ms(time.perf_counter() - self.started),
+            'queries': self.queries,
+            'db_ms': ms(self.db_time),
+            'template_ms': ms(self.template_time),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса."""
+    return getattr(local, 'metrics', None)
+
+
+def record_cache(hits=0, misses=0):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class Histogram:
+    """Последние WINDOW замеров каждого представления."""
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.lock = threading.Lock()
+
+    def add(self, name, sample):
+        with self.lock:
+            self.samples[name].append(sample)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def snapshot(self):
+        with self.lock:
+            samples = {name: list(rows) for name, rows in self.samples.items()}
+        return {name: summarize(rows) for name, rows in samples.items()}
+
+
+def summarize(rows):
+    totals = sorted(row['total_ms'] for row in rows)
+    buckets = dict.fromkeys([*map(str, BUCKETS), 'inf'], 0)
+    for total in totals:
+        bucket = next((b for b in BUCKETS if total <= b), 'inf')
+        buckets[str(bucket)] += 1
+    return {
+        'count': len(totals),
+        'p50_ms': totals[len(totals) // 2],
+        'p95_ms': totals[int(len(totals) * 0.95)],
+        'p99_ms': totals[int(len(totals) * 0.99)],
+        'max_ms': totals[-1],
+        'queries_mean': round(
+            statistics.mean(row['queries'] for row in rows), 2
+        ),
+        'db_ms_mean': round(
+            statistics.mean(row['db_ms'] for row in rows), 3
+        ),
+        'buckets': buckets,
+    }
+
+
+histogram = Histogram()
+
+
+def server_timing(sample):
+    return ', '.join((
+        f'total;dur={sample["total_ms"]}',
+        f'db;dur={sample["db_ms"]};desc="{sample["queries"]} queries"',
+        f'tpl;dur={sample["template_ms"]}',
+        f'cache;desc="hit={sample["cache_hits"]} '
+        f'miss={sample["cache_misses"]}"',
+    ))
+
+
+class MetricsMiddleware:
+    """Замеряет запрос целиком; ставить первым в ``MIDDLEWARE``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = local.metrics = RequestMetrics()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            local.metrics = None
+        sample = metrics.as_dict()
+        match = request.resolver_match
+        name = match.view_name if match else '<unresolved>'
+        histogram.add(name, sample)
+        if SERVER_TIMING:
+            response['Server-Timing'] = server_timing(sample)
+        if LOG:
+            logger.info(json.dumps(dict(
+                sample, view=name, method=request.method,
+                path=request.path, status=response.status_code,
+            )))
+        return response
+
+
+def timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        metrics = current()
+        if metrics is None:
+            return render(self, *args, **kwargs)
+        # Виджеты форм рендерятся вложенно: считаем только внешний вызов.
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+    wrapper.timed = True
+    return wrapper
+
+
+def install():
+    """Оборачивает рендеринг шаблонов Django; вызывается из ready()."""
+    template = django_backend.Template
+    if not getattr(template.render, 'timed', False):
+        template.render = timed_render(template.render)
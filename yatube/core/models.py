@@ -1,3 +1,22 @@
-# from django.db import models
+from django.db import models
 
-# Create your models here.
+
+class ThumbnailJob(models.Model):
+    """Изображение, для которого нужно сгенерировать миниатюры."""
+    source = models.CharField('Файл', max_length=255, unique=True)
+    created = models.DateTimeField('Поставлено в очередь', auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    error = models.TextField('Последняя ошибка', blank=True)
+
+    def __str__(self):
+        return self.source
+
+
+class StoredFile(models.Model):
+    """Файл хранилища по хешу содержимого и число ссылок на него."""
+    name = models.CharField('Файл', max_length=255, unique=True)
+    refs = models.PositiveIntegerField('Ссылок', default=0)
+    size = models.PositiveIntegerField('Размер в байтах', default=0)
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,134 @@
+"""Кеш целых страниц для анонимных посетителей.
+
+Страница кешируется по хосту, пути и строке запроса вместе с отметками
+изменения данных, от которых она зависит (те же имена, что у условного
+GET: ``post:1``, ``author:2``, ``group:3``). Если хотя бы одна отметка
+новее сохранённой или истёк PAGE_CACHE_TIMEOUT, страница устарела.
+Перестраивает её только один запрос - тот, кто взял блокировку, -
+остальные в это время получают устаревшую копию.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from .conditional import page_modified
+
+# Сколько секунд страница считается свежей без изменений данных.
+TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+# Сколько хранится устаревшая копия, которую можно отдать, пока
+# страница перестраивается.
+STALE_TIMEOUT = getattr(settings, 'PAGE_CACHE_STALE_TIMEOUT', 60 * 60 * 24)
+LOCK_TIMEOUT = getattr(settings, 'PAGE_CACHE_LOCK_TIMEOUT', 30)
+# Сколько ждать чужой перестройки, если устаревшей копии нет.
+WAIT = getattr(settings, 'PAGE_CACHE_WAIT', 2)
+POLL_INTERVAL = 0.05
+
+HIT = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+BYPASS = 'bypass'
+
+
+def is_anonymous(request):
+    # Смотрим только на куки: загрузка сессии стоила бы запроса к базе.
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and settings.CSRF_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def page_key(request):
+    url = request.get_host() + request.get_full_path()
+    return 'page:' + hashlib.md5(url.encode()).hexdigest()
+
+
+def lock_key(key):
+    return key + ':lock'
+
+
+def is_fresh(entry, modified):
+    return (
+        entry['modified'] == modified
+        and entry['expires'] > time.time()
+    )
+
+
+def is_cacheable(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+    )
+
+
+def wait_for_entry(key, modified):
+    deadline = time.monotonic() + WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None and is_fresh(entry, modified):
+            return entry
+    return None
+
+
+def mark(response, state):
+    response['X-Page-Cache'] = state
+    # Без Vary прокси отдал бы анонимную копию вошедшему пользователю.
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def regenerate(key, modified, render):
+    """Строит страницу под блокировкой и сохраняет её в кеш."""
+    try:
+        response = render()
+        if is_cacheable(response):
+            cache.set(key, {
+                'modified': modified,
+                'expires': time.time() + TIMEOUT,
+                'response': response,
+            }, STALE_TIMEOUT)
+    finally:
+        cache.delete(lock_key(key))
+    return mark(response, MISS)
+
+
+def serve(key, modified, render):
+    entry = cache.get(key)
+    if entry is not None and is_fresh(entry, modified):
+        return mark(entry['response'], HIT)
+    if cache.add(lock_key(key), 1, LOCK_TIMEOUT):
+        return regenerate(key, modified, render)
+    # Страницу уже перестраивает другой запрос.
+    if entry is not None:
+        return mark(entry['response'], STALE)
+    entry = wait_for_entry(key, modified)
+    if entry is not None:
+        return mark(entry['response'], HIT)
+    return mark(render(), MISS)
+
+
+def cache_anonymous_page(depends_on):
+    """Декоратор представления: кеш страницы для анонимных посетителей.
+
+    depends_on - та же функция, что у ``conditional_page``.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            def render():
+                return view(request, *args, **kwargs)
+
+            if not is_anonymous(request):
+                return mark(render(), BYPASS)
+            modified = page_modified(request, depends_on, kwargs)
+            if not modified:
+                return render()
+            return serve(page_key(request), modified, render)
+        return wrapper
+    return decorator
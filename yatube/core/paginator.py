@@ -0,0 +1,165 @@
+import base64
+import json
+
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class CursorPage(Page):
+    """Страница без общего числа строк.
+
+    Признаки соседних страниц берутся из курсоров, номер есть только у
+    страниц, открытых по ``?page=N``. Ни один метод не обращается к
+    ``paginator.count``, поэтому ``COUNT(*)`` не выполняется.
+    """
+
+    def __init__(self, object_list, number, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, number, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        if self.number is None:
+            return '<Page по курсору>'
+        return f'<Page {self.number}>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def next_page_number(self):
+        if self.number is None or not self.has_next():
+            raise EmptyPage('Следующей страницы нет')
+        return self.number + 1
+
+    def previous_page_number(self):
+        if self.number is None or not self.has_previous():
+            raise EmptyPage('Предыдущей страницы нет')
+        return self.number - 1
+
+    def start_index(self):
+        if self.number is None or not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        if self.number is None or not self.object_list:
+            return 0
+        return self.start_index() + len(self.object_list) - 1
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинатор по паре (date_field, pk_field).
+
+    Страница выбирается условием ``WHERE (date, pk) < (курсор)`` вместо
+    ``OFFSET``, поэтому глубокие страницы стоят столько же, сколько первая,
+    а ``COUNT(*)`` не выполняется. Курсор - непрозрачная строка для
+    параметра ``?cursor=``. Номер ``?page=N`` поддерживается для старых
+    ссылок, но тоже без подсчёта строк.
+    """
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 pk_field='pk'):
+        self.date_field = date_field
+        self.pk_field = pk_field
+        super().__init__(
+            object_list.order_by(f'-{date_field}', f'-{pk_field}'), per_page
+        )
+
+    def get_page(self, number=None, cursor=None):
+        if cursor:
+            try:
+                direction, position = self.decode_cursor(cursor)
+            except (TypeError, ValueError):
+                pass
+            else:
+                return self.cursor_page(direction, position)
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = self.fetch(offset=offset)
+        return self.build_page(
+            rows, number,
+            has_previous=number > 1,
+            has_next=len(rows) > self.per_page,
+        )
+
+    def cursor_page(self, direction, position):
+        rows = self.fetch(direction, position)
+        if direction == NEXT:
+            return self.build_page(
+                rows, None,
+                has_previous=True,
+                has_next=len(rows) > self.per_page,
+            )
+        return self.build_page(
+            rows[:self.per_page][::-1], None,
+            has_previous=len(rows) > self.per_page,
+            has_next=True,
+        )
+
+    def fetch(self, direction=NEXT, position=None, offset=0):
+        """Строки страницы плюс одна лишняя - признак продолжения."""
+        return self.slice(
+            self.object_list, direction, position,
+            offset, offset + self.per_page + 1,
+        )
+
+    def slice(self, queryset, direction, position, start, stop,
+              pk_field=None):
+        if position is not None:
+            queryset = queryset.filter(
+                self.keyset_condition(direction, position, pk_field)
+            )
+        if direction == PREVIOUS:
+            queryset = queryset.reverse()
+        return list(queryset[start:stop])
+
+    def keyset_condition(self, direction, position, pk_field=None):
+        date, pk = position
+        pk_field = pk_field or self.pk_field
+        lookup = 'lt' if direction == NEXT else 'gt'
+        # Избыточное нестрогое условие по дате даёт SQLite границу для
+        # поиска по индексу: одно OR-условие заставило бы сканировать его.
+        return Q(**{f'{self.date_field}__{lookup}e': date}) & (
+            Q(**{f'{self.date_field}__{lookup}': date})
+            | Q(**{self.date_field: date, f'{pk_field}__{lookup}': pk})
+        )
+
+    def build_page(self, rows, number, has_previous, has_next):
+        rows = rows[:self.per_page]
+        page = CursorPage(rows, number, self)
+        if rows and has_next:
+            page.next_cursor = self.encode_cursor(NEXT, rows[-1])
+        if rows and has_previous:
+            page.previous_cursor = self.encode_cursor(PREVIOUS, rows[0])
+        return page
+
+    def position(self, obj):
+        return getattr(obj, self.date_field), getattr(obj, self.pk_field)
+
+    def encode_cursor(self, direction, obj):
+        date, pk = self.position(obj)
+        raw = json.dumps([direction, date.isoformat(), pk])
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        padding = '=' * (-len(cursor) % 4)
+        try:
+            raw = base64.urlsafe_b64decode(cursor + padding)
+            direction, date, pk = json.loads(raw)
+        except Exception as error:
+            raise ValueError('Некорректный курсор') from error
+        date = parse_datetime(date)
+        if direction not in (NEXT, PREVIOUS) or date is None:
+            raise ValueError('Некорректный курсор')
+        return direction, (date, int(pk))
@@ -0,0 +1,113 @@
+"""Чтение лент с реплик базы данных.
+
+Представления, обёрнутые ``replica_reads``, читают модели приложений
+REPLICA_APPS с одной из реплик ``DATABASE_REPLICAS``; все записи и все
+остальные чтения идут в ``default``. Реплика отстаёт от основной базы
+на время между синхронизациями, поэтому основная база читается и там:
+
+- REPLICA_STICKY_SECONDS после записи этого же клиента (кука), чтобы
+  автор сразу видел свой пост, комментарий или подписку - в том числе
+  записанную GET-запросом вроде ``profile_follow``;
+- на страницах, данные которых изменились за это же время: иначе кеш
+  страниц и ETag закрепили бы устаревшую копию как свежую.
+"""
+import random
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+# Сессии и прочие служебные таблицы всегда читаются с основной базы.
+APPS = getattr(settings, 'REPLICA_APPS', ('posts', 'auth'))
+PIN_COOKIE = 'primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+local = threading.local()
+
+
+def replicas():
+    """Алиасы реплик, которые не совпадают с основной базой.
+
+    В тестах реплика - зеркало default с тем же именем базы, но своим
+    соединением, которое не видит данных внутри транзакции теста.
+    """
+    primary = connections.databases['default']['NAME']
+    return [
+        alias for alias in getattr(settings, 'DATABASE_REPLICAS', [])
+        if connections.databases.get(alias, {}).get('NAME') != primary
+    ]
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def is_recently_modified(request):
+    # Отметки уже посчитаны условным GET или кешем страниц.
+    modified = getattr(request, '_page_modified', None)
+    return bool(modified) and (
+        max(modified.values()) > time.time() - STICKY_SECONDS
+    )
+
+
+def replica_reads(view):
+    """Декоратор представления: чтения идут на реплику, если можно."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        aliases = replicas()
+        if (not aliases or is_pinned(request)
+                or is_recently_modified(request)):
+            return view(request, *args, **kwargs)
+        local.replica = random.choice(aliases)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            local.replica = None
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = getattr(local, 'replica', None)
+        if replica and model._meta.app_label in APPS:
+            return replica
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in APPS:
+            local.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы с теми же строками.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Схема попадает на реплику вместе с данными при синхронизации.
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """После записи клиент какое-то время читает с основной базы."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        local.wrote = False
+        response = self.get_response(request)
+        wrote = local.wrote or request.method not in SAFE_METHODS
+        if wrote and replicas():
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + STICKY_SECONDS),
+                max_age=STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
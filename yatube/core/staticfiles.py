@@ -0,0 +1,160 @@
+"""Статика с хешами в именах, предварительным сжатием и своей раздачей.
+
+``collectstatic`` копирует файлы в STATIC_ROOT под именами с хешем
+содержимого (``ManifestStaticFilesStorage``), а тег ``{% static %}``
+подставляет эти имена из манифеста. Текстовые файлы сразу сжимаются
+в соседние ``.gz`` и ``.br``. Пакет ``brotli`` указан в requirements.txt;
+без него collectstatic пишет только ``.gz``.
+
+Раздача (``serve``) выбирает лучший вариант по ``Accept-Encoding`` и
+кеширует файлы с хешем навсегда с ``immutable``, поэтому сайт обходится
+без отдельной настройки CDN или фронтенд-сервера для статики.
+"""
+import gzip
+import mimetypes
+import os
+import stat
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage
+)
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.functional import cached_property
+from django.views.decorators.http import condition
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_MAX_AGE = getattr(
+    settings, 'STATIC_IMMUTABLE_MAX_AGE', 365 * 24 * 60 * 60
+)
+MAX_AGE = getattr(settings, 'STATIC_MAX_AGE', 60 * 60)
+COMPRESS_EXTENSIONS = (
+    '.css', '.js', '.svg', '.ico', '.json', '.map', '.txt', '.xml',
+    '.html', '.eot', '.ttf', '.otf',
+)
+# Файлы меньше не сжимаются: выигрыш съедят заголовки.
+COMPRESS_MIN_SIZE = 256
+# Сжатый вариант хранится, только если он хотя бы на 5% меньше.
+COMPRESS_RATIO = 0.95
+
+ENCODERS = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+if brotli is not None:
+    ENCODERS.insert(0, ('.br', brotli.compress))
+# Порядок предпочтения кодировок при раздаче.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        # До collectstatic (разработка, тесты) манифеста нет: ссылки
+        # ведут на исходные имена.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    @cached_property
+    def hashed_names(self):
+        return frozenset(self.hashed_files.values())
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(paths).union(self.hashed_files.values()):
+            if name.lower().endswith(COMPRESS_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        for suffix, encode in ENCODERS:
+            compressed = None
+            if len(data) >= COMPRESS_MIN_SIZE:
+                compressed = encode(data)
+            if compressed and len(compressed) < len(data) * COMPRESS_RATIO:
+                with open(path + suffix, 'wb') as file:
+                    file.write(compressed)
+            elif os.path.exists(path + suffix):
+                # Вариант от прошлого collectstatic отдавался бы вместо
+                # нового содержимого файла.
+                os.remove(path + suffix)
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        encoding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00'):
+            accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def static_file(request, path):
+    """Путь, ``stat`` и кодировка лучшего варианта файла для запроса."""
+    if not hasattr(request, '_static_file'):
+        try:
+            full_path = safe_join(settings.STATIC_ROOT, path)
+        except ValueError:
+            raise Http404('Файл не найден')
+        accepted = accepted_encodings(request)
+        variants = [
+            (full_path + suffix, encoding)
+            for encoding, suffix in ENCODINGS if encoding in accepted
+        ] + [(full_path, None)]
+        for variant_path, encoding in variants:
+            try:
+                result = os.stat(variant_path)
+            except OSError:
+                continue
+            if stat.S_ISREG(result.st_mode):
+                request._static_file = variant_path, result, encoding
+                break
+        else:
+            raise Http404('Файл не найден')
+    return request._static_file
+
+
+def static_etag(request, path):
+    _, result, encoding = static_file(request, path)
+    return f'{result.st_mtime_ns:x}-{result.st_size:x}-{encoding or ""}'
+
+
+def file_response(request, path):
+    variant_path, result, encoding = static_file(request, path)
+    content_type = mimetypes.guess_type(path)[0]
+    response = FileResponse(
+        open(variant_path, 'rb'),
+        content_type=content_type or 'application/octet-stream',
+    )
+    response['Content-Length'] = result.st_size
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+conditional_file = condition(etag_func=static_etag)(file_response)
+
+
+def is_hashed(path):
+    return path in getattr(staticfiles_storage, 'hashed_names', ())
+
+
+def serve(request, path):
+    response = conditional_file(request, path)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if is_hashed(path):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, max_age=MAX_AGE)
+    return response
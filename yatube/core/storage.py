@@ -0,0 +1,110 @@
+"""Хранилище файлов с адресацией по содержимому.
+
+Имя файла - SHA-256 его байтов: ``posts/ab/abcd....jpg``. Одинаковые
+загрузки хранятся один раз, и миниатюры sorl-thumbnail, имена которых
+зависят от имени источника, тоже общие. Каждое сохранение добавляет
+ссылку в ``StoredFile``, а ``release`` снимает её; файл удаляется
+только вместе с последней ссылкой.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+CHUNK_SIZE = 64 * 1024
+
+
+def file_digest(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    directory, basename = os.path.split(name)
+    stem, extension = os.path.splitext(basename)
+    if stem == digest:
+        return name
+    extension = extension.lower()
+    return os.path.join(directory, digest[:2], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Имя всё равно заменит хеш, а одинаковому содержимому и нужно
+        # одно и то же имя.
+        return name
+
+    def _save(self, name, content):
+        name = hashed_name(name, file_digest(content))
+        if not self.exists(name):
+            # FileSystemStorage._save на занятом имени повторяет попытки
+            # с именем от get_available_name, то есть бесконечно. Поэтому
+            # файл пишется под уникальным временным именем и ставится на
+            # место жёсткой ссылкой.
+            temporary = super()._save(
+                f'{name}.{uuid.uuid4().hex}.part', content
+            )
+            try:
+                os.link(self.path(temporary), self.path(name))
+            except FileExistsError:
+                # Те же байты успел записать параллельный запрос.
+                pass
+            finally:
+                super().delete(temporary)
+        self.retain(name, content.size)
+        return name
+
+    def retain(self, name, size=0, count=1):
+        StoredFile.objects.get_or_create(name=name, defaults={'size': size})
+        StoredFile.objects.filter(name=name).update(refs=F('refs') + count)
+
+    def release(self, name):
+        """Снимает одну ссылку; True, если файл больше никому не нужен.
+
+        Для файлов без учёта ссылок (загруженных до этого хранилища)
+        тоже True: проверять другие ссылки должен вызывающий.
+        """
+        with transaction.atomic():
+            if StoredFile.objects.filter(name=name, refs__gt=1).update(
+                refs=F('refs') - 1
+            ):
+                return False
+            StoredFile.objects.filter(name=name).delete()
+        return True
+
+    def delete(self, name):
+        if self.release(name):
+            super().delete(name)
+
+    def rebuild_refs(self, counts):
+        """Пересчитывает ссылки по парам (имя, число ссылок).
+
+        Возвращает число исправленных строк.
+        """
+        counts = dict(counts)
+        stored = dict(StoredFile.objects.values_list('name', 'refs'))
+        fixed = 0
+        with transaction.atomic():
+            stale = set(stored).difference(counts)
+            StoredFile.objects.filter(name__in=stale).delete()
+            fixed += len(stale)
+            for name, refs in counts.items():
+                if stored.get(name) == refs:
+                    continue
+                size = self.size(name) if self.exists(name) else 0
+                StoredFile.objects.update_or_create(
+                    name=name, defaults={'refs': refs, 'size': size}
+                )
+                fixed += 1
+        return fixed
+
+
+content_storage = ContentAddressedStorage()
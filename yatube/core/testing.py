@@ -0,0 +1,40 @@
+"""Окружение тестов: общий кеш во временном файле.
+
+Иначе тесты писали бы в тот же ``cache.sqlite3``, что и сервер
+разработки, и страницы, версии и отметки изменений одного запуска
+доставались бы следующему.
+"""
+import copy
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+@contextmanager
+def temporary_cache():
+    directory = tempfile.mkdtemp()
+    caches = copy.deepcopy(settings.CACHES)
+    caches['shared']['LOCATION'] = os.path.join(directory, 'cache.sqlite3')
+    try:
+        with override_settings(CACHES=caches):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск ``manage.py test`` с временным общим кешем."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache = temporary_cache()
+        self.cache.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -1,4 +1,25 @@
-from django.test import Client, TestCase
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import closing
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.templatetags.static import static
+from django.urls import reverse
+
+from posts.models import Post
+
+from . import db, metrics, routers
+from .cache_backends import SQLiteCache, TieredCache
+
+User = get_user_model()
 
 
 class CoreTestClass(TestCase):
@@ -8,3 +29,279 @@ class CoreTestClass(TestCase):
     def test_404_page_template(self):
         response = self.client.get('nonexist-page')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class CacheBackendsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shared = SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'), {}
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_sqlite_cache_operations(self):
+        """SQLiteCache поддерживает основной API кеша Django"""
+        cache = self.shared
+        cache.set('key', {'a': 1})
+        self.assertEqual(cache.get('key'), {'a': 1})
+        self.assertFalse(cache.add('key', 'other'))
+        self.assertTrue(cache.add('new', 1))
+        self.assertEqual(cache.incr('new', 5), 6)
+        self.assertEqual(cache.get_many(['key', 'new', 'missing']), {
+            'key': {'a': 1}, 'new': 6,
+        })
+        cache.set('expired', 1, timeout=-1)
+        self.assertIsNone(cache.get('expired'))
+        self.assertTrue(cache.add('expired', 2))
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_sqlite_cache_is_shared_between_instances(self):
+        """Разные экземпляры (процессы) видят один и тот же файл"""
+        self.shared.set('key', 'value')
+        other = SQLiteCache(self.shared.path, {})
+        self.assertEqual(other.get('key'), 'value')
+
+    def test_tiered_cache_local_tier(self):
+        """TieredCache отдаёт горячие ключи из памяти процесса"""
+        shared_settings = {
+            'BACKEND': 'core.cache_backends.SQLiteCache',
+            'LOCATION': self.shared.path,
+        }
+        caches_settings = dict(settings.CACHES, test_shared=shared_settings)
+        with override_settings(CACHES=caches_settings):
+            tiered = TieredCache('', {'OPTIONS': {
+                'SHARED': 'test_shared',
+                'LOCAL_MAX_ENTRIES': 1,
+            }})
+            tiered.set('first', 1)
+            self.shared.clear()
+            self.assertEqual(tiered.get('first'), 1)
+            self.shared.set('second', 2)
+            self.assertEqual(tiered.get('second'), 2)
+            self.assertIsNone(tiered.get('first'))
+            tiered.set('counter', 1)
+            tiered.incr('counter')
+            self.assertEqual(self.shared.get('counter'), 2)
+            self.assertEqual(tiered.get('counter'), 2)
+
+
+class DatabaseProfileTest(TestCase):
+    def test_production_pragmas(self):
+        """Новое соединение получает PRAGMA из SQLITE_PRAGMAS"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        wrapper = DatabaseWrapper(dict(
+            settings.DATABASES['default'],
+            NAME=os.path.join(directory, 'db.sqlite3'),
+        ))
+        self.addCleanup(wrapper.close)
+        pragmas = settings.SQLITE_PRODUCTION_PRAGMAS
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            self.assertEqual(db.pragma(wrapper, 'journal_mode'), 'wal')
+            for name in ('busy_timeout', 'cache_size', 'mmap_size'):
+                with self.subTest(pragma=name):
+                    self.assertEqual(db.pragma(wrapper, name), pragmas[name])
+
+
+@override_settings(DATABASE_REPLICAS=['test_replica'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def read_aliases(self, request):
+        @routers.replica_reads
+        def view(request):
+            return (
+                self.router.db_for_read(Post),
+                self.router.db_for_read(Session),
+            )
+        return view(request)
+
+    def test_feed_reads_go_to_replica(self):
+        """Ленты читают посты с реплики, а сессии и записи - с default"""
+        request = RequestFactory().get('/')
+        self.assertEqual(
+            self.read_aliases(request), ('test_replica', 'default')
+        )
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+        self.assertEqual(self.router.db_for_write(Post), 'default')
+
+    def test_reads_stick_to_primary_after_post(self):
+        """После POST клиент читает с основной базы"""
+        user = User.objects.create_user(username='writer')
+        self.client.force_login(user)
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': 'Новый пост',
+        })
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        request = RequestFactory().get('/')
+        request.COOKIES[routers.PIN_COOKIE] = (
+            response.cookies[routers.PIN_COOKIE].value
+        )
+        self.assertEqual(self.read_aliases(request), ('default', 'default'))
+
+    def test_follow_by_get_pins_primary(self):
+        """Подписка GET-запросом тоже закрепляет чтение за default"""
+        author = User.objects.create_user(username='author')
+        self.client.force_login(User.objects.create_user(username='reader'))
+        response = self.client.get(reverse('posts:post_create'))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        response = self.client.get(
+            reverse('posts:profile_follow', args=[author.username])
+        )
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_backup_copies_database(self):
+        """db.backup переносит данные в файл реплики"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = os.path.join(directory, 'db.sqlite3')
+        target = os.path.join(directory, 'replica.sqlite3')
+        with closing(sqlite3.connect(source)) as source_db:
+            source_db.execute('CREATE TABLE post (text TEXT)')
+            source_db.execute("INSERT INTO post VALUES ('пост')")
+            source_db.commit()
+        db.backup(source, target)
+        with closing(sqlite3.connect(target)) as target_db:
+            rows = target_db.execute('SELECT text FROM post').fetchall()
+        self.assertEqual(rows, [('пост',)])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.histogram.clear()
+
+    def test_server_timing_header(self):
+        """Ответ содержит Server-Timing с временем SQL и шаблонов"""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'tpl;dur=', 'cache;desc='):
+            self.assertIn(metric, timing)
+
+    def test_metrics_endpoint_is_admin_only(self):
+        """Окно замеров доступно только персоналу"""
+        url = reverse('metrics')
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        admin = User.objects.create_user('admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()['posts:index']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(sum(stats['buckets'].values()), 1)
+
+
+class MediaServeTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.name = 'posts/ab/' + 'ab' * 32 + '.png'
+        os.makedirs(os.path.join(self.directory, 'posts', 'ab'))
+        with open(os.path.join(self.directory, self.name), 'wb') as file:
+            file.write(b'0123456789')
+        self.url = settings.MEDIA_URL + self.name
+        override = override_settings(MEDIA_ROOT=self.directory)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_file_is_cached_forever_and_revalidated(self):
+        """Файл по хешу кешируется навсегда, повтор с ETag - 304"""
+        response = self.client.get(self.url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], '"' + 'ab' * 32 + '"')
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+        missing = self.client.get(settings.MEDIA_URL + 'posts/missing.png')
+        self.assertEqual(missing.status_code, 404)
+
+    def test_range_requests(self):
+        """Один диапазон - 206 с Content-Range, за концом файла - 416"""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(response['Content-Length'], '3')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        """С MEDIA_ACCEL_REDIRECT файл отдаёт nginx"""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/' + self.name
+        )
+        self.assertEqual(response.content, b'')
+
+
+class StaticPipelineTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        source = os.path.join(self.directory, 'source', 'css')
+        os.makedirs(source)
+        with open(os.path.join(source, 'site.css'), 'w') as file:
+            file.write('body { color: black; }\n' * 100)
+        override = override_settings(
+            STATICFILES_DIRS=[os.path.join(self.directory, 'source')],
+            STATIC_ROOT=os.path.join(self.directory, 'root'),
+            INSTALLED_APPS=['django.contrib.staticfiles'],
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_hashed_and_precompressed(self):
+        """Имена статики с хешем, .gz рядом, раздача выбирает сжатый"""
+        url = static('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.\w{12}\.css$')
+        self.assertTrue(os.path.exists(staticfiles_storage.path(
+            url[len(settings.STATIC_URL):] + '.gz'
+        )))
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(
+            b''.join(plain.streaming_content).count(b'body'), 100
+        )
+        source = self.client.get('/static/css/site.css')
+        self.assertNotIn('immutable', source['Cache-Control'])
+
+    def test_stale_compressed_copy_removed(self):
+        """Сжатая копия прошлой версии удаляется, если новая не сжимается"""
+        path = os.path.join(self.directory, 'source', 'css', 'site.css')
+        with open(path, 'w') as file:
+            file.write('body {}')
+        # collectstatic сравнивает время изменения с точностью до секунды.
+        later = os.stat(path).st_mtime + 2
+        os.utime(path, (later, later))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.assertFalse(
+            os.path.exists(staticfiles_storage.path('css/site.css.gz'))
+        )
+        response = self.client.get(
+            '/static/css/site.css', HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -0,0 +1,189 @@
+"""Фоновая генерация миниатюр без внешнего брокера.
+
+Запрос страницы никогда не открывает исходное изображение: шаблон берёт
+только уже готовую миниатюру из key-value хранилища sorl-thumbnail.
+Если её нет, источник ставится в очередь ``ThumbnailJob`` в базе, а
+миниатюры генерирует команда ``manage.py process_thumbnails``.
+
+Для каждого источника создаются варианты всех ширин THUMBNAIL_WIDTHS в
+каждом формате THUMBNAIL_FORMATS, которые умеет кодировать Pillow;
+последний формат - запасной для браузеров без остальных.
+"""
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.dispatch import Signal
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from PIL import features
+
+from .models import ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = getattr(settings, 'THUMBNAIL_WIDTHS', (320, 640, 960))
+# Пропорции обрезки в лентах: 960x339.
+RATIO = getattr(settings, 'THUMBNAIL_RATIO', 339 / 960)
+MAX_ATTEMPTS = getattr(settings, 'THUMBNAIL_MAX_ATTEMPTS', 3)
+# Формат Pillow: (MIME-тип, имя возможности в PIL.features).
+MIME_TYPES = {
+    'WEBP': ('image/webp', 'webp'),
+    'JPEG': ('image/jpeg', 'jpg'),
+    'PNG': ('image/png', 'zlib'),
+}
+FORMATS = tuple(
+    name for name in getattr(settings, 'THUMBNAIL_FORMATS', ('WEBP', 'JPEG'))
+    if features.check(MIME_TYPES[name][1])
+) or ('JPEG',)
+FALLBACK_FORMAT = FORMATS[-1]
+
+Variant = namedtuple('Variant', 'format width geometry options')
+Picture = namedtuple('Picture', 'src srcset width height ready sources')
+
+
+def build_variants():
+    return tuple(
+        Variant(format, width, f'{width}x{round(width * RATIO)}', {
+            'crop': 'center', 'upscale': True, 'format': format,
+        })
+        for format in FORMATS for width in sorted(WIDTHS)
+    )
+
+
+VARIANTS = build_variants()
+# Самый широкий вариант запасного формата - src для старых браузеров.
+DEFAULT_VARIANT = VARIANTS[-1]
+
+# Миниатюры источника name готовы: страницы с ним изменились.
+thumbnail_ready = Signal(providing_args=['name'])
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, умеющий искать миниатюру без генерации."""
+
+    def normalize_options(self, source, options):
+        # Те же умолчания, что в ThumbnailBackend.get_thumbnail, иначе
+        # имя миниатюры не совпадёт с созданным воркером.
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """Готовая миниатюра или None, если её ещё не сгенерировали."""
+        # Ключ миниатюры зависит от хранилища источника. Воркер
+        # передаёт имя файла, то есть хранилище по умолчанию; у поля
+        # картинки своё хранилище по хешу с тем же каталогом.
+        source = ImageFile(getattr(file_, 'name', file_), default.storage)
+        options = self.normalize_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = QueuedThumbnailBackend()
+
+
+def get_ready_thumbnail(image, variant=DEFAULT_VARIANT):
+    try:
+        return backend.get_ready_thumbnail(
+            image, variant.geometry, **variant.options
+        )
+    except Exception:
+        logger.exception('Не удалось найти миниатюру %s', image)
+        return None
+
+
+def is_complete(image):
+    """Готовы ли все варианты миниатюр источника."""
+    return all(get_ready_thumbnail(image, v) for v in VARIANTS)
+
+
+def srcset(thumbnails):
+    return ', '.join(f'{t.url} {t.width}w' for t in thumbnails)
+
+
+def picture(image):
+    """Варианты для ``<picture>``; пока их нет - исходное изображение.
+
+    sources - пары (MIME-тип, srcset) для форматов кроме запасного,
+    srcset и src - для ``<img>`` в запасном формате.
+    """
+    if not image:
+        return None
+    ready = {}
+    for variant in VARIANTS:
+        thumbnail = get_ready_thumbnail(image, variant)
+        if thumbnail:
+            ready.setdefault(variant.format, []).append(thumbnail)
+    fallback = ready.pop(FALLBACK_FORMAT, None)
+    if not fallback:
+        return Picture(image.url, '', None, None, False, [])
+    sources = [
+        (MIME_TYPES[format][0], srcset(thumbnails))
+        for format, thumbnails in ready.items()
+    ]
+    largest = fallback[-1]
+    return Picture(
+        largest.url, srcset(fallback), largest.width, largest.height,
+        True, sources,
+    )
+
+
+def enqueue(*names):
+    ThumbnailJob.objects.bulk_create(
+        (ThumbnailJob(source=name) for name in names if name),
+        ignore_conflicts=True,
+    )
+
+
+def generate(name):
+    """Создаёт все миниатюры источника; вызывается только воркером."""
+    for variant in VARIANTS:
+        default.backend.get_thumbnail(
+            name, variant.geometry, **variant.options
+        )
+
+
+def process(job_id):
+    job = ThumbnailJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return
+    try:
+        generate(job.source)
+    except Exception as error:
+        logger.exception('Ошибка генерации миниатюры %s', job.source)
+        ThumbnailJob.objects.filter(pk=job.pk).update(
+            attempts=job.attempts + 1, error=str(error)
+        )
+    else:
+        job.delete()
+        thumbnail_ready.send(sender=ThumbnailJob, name=job.source)
+
+
+def delete(*names):
+    """Удаляет исходные файлы, их миниатюры и задачи очереди."""
+    names = [name for name in names if name]
+    ThumbnailJob.objects.filter(source__in=names).delete()
+    for name in names:
+        try:
+            default.backend.delete(name)
+        except Exception:
+            logger.exception('Не удалось удалить изображение %s', name)
+
+
+def pending_jobs(limit):
+    return list(
+        ThumbnailJob.objects.filter(attempts__lt=MAX_ATTEMPTS)
+        .order_by('pk')
+        .values_list('pk', flat=True)[:limit]
+    )
@@ -1,4 +1,10 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views.decorators.http import require_safe
+
+from . import media as media_files, metrics as request_metrics
+from . import staticfiles
 
 
 def page_not_found(request, exception):
@@ -15,3 +21,18 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+@staff_member_required
+def metrics(request):
+    return JsonResponse(request_metrics.histogram.snapshot())
+
+
+@require_safe
+def media(request, path):
+    return media_files.serve(request, path)
+
+
+@require_safe
+def static(request, path):
+    return staticfiles.serve(request, path)
@@ -1,9 +1,29 @@
 from django.contrib import admin
 
+from . import deletion
 from .models import Post, Group
+from .search import filter_posts
 
 
-class PostAdmin(admin.ModelAdmin):
+class BackgroundDeleteMixin:
+    """Удаление из админки через очередь DeletionJob, а не каскадом."""
+
+    def get_deleted_objects(self, objs, request):
+        # Стандартное подтверждение собирает весь каскад в память.
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        return [str(obj) for obj in objs], {}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        deletion.schedule(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            deletion.schedule(obj)
+
+
+class PostAdmin(BackgroundDeleteMixin, admin.ModelAdmin):
     list_display = ('pk',
                     'text',
                     'pub_date',
@@ -15,6 +35,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по индексу FTS5 вместо LIKE '%...%' по всей таблице.
+        return filter_posts(queryset, search_term), False
+
+
+class GroupAdmin(BackgroundDeleteMixin, admin.ModelAdmin):
+    pass
+
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
@@ -0,0 +1,406 @@
+"""Наполнение базы большим набором данных и замеры лент и представлений.
+
+Данные вставляются через ``bulk_create`` пачками, сигналы при этом не
+срабатывают, поэтому счётчики и ленты подписок пересчитываются в конце
+одним проходом.
+"""
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import (
+    OperationalError, close_old_connections, connection, connections,
+    transaction,
+)
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from faker import Faker
+
+from core.db import close_connections
+from core.paginator import NEXT, CursorPaginator
+from . import counters, timeline
+from .models import Comment, Follow, Group, Post, TimelineEntry, User
+
+BATCH_SIZE = 1000
+PER_PAGE = 10
+PUB_DATE_SPAN = 60 * 60 * 24 * 365
+
+READ = 'read'
+WRITE = 'write'
+# Процессы нагрузки не делят кеш: замеряется только база.
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+# Индексы, добавленные под формы запросов лент.
+FEED_INDEXES = (
+    'post_pub_date_id_idx',
+    'post_group_pub_date_idx',
+    'post_author_pub_date_idx',
+    'comment_post_created_idx',
+    'timeline_user_pub_date_idx',
+)
+
+SPREAD_PUB_DATE_SQL = '''
+UPDATE posts_post
+SET pub_date = datetime('now', '-' || (abs(random()) %% %s) || ' seconds')
+WHERE id BETWEEN %s AND %s
+'''
+
+
+def batches(objects, size=BATCH_SIZE):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_insert(model, objects):
+    for batch in batches(objects):
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def seed(users=100, groups=10, posts=10000, comments=10000, follows=1000,
+         seed=0):
+    """Создаёт набор данных и возвращает его описание.
+
+    Тексты берутся из заранее сгенерированного Faker пула: генерация
+    текста на каждую строку заняла бы больше времени, чем сама вставка.
+    """
+    fake = Faker('ru_RU')
+    fake.seed_instance(seed)
+    rnd = random.Random(seed)
+    prefix = uuid.uuid4().hex[:8]
+    texts = [fake.text(max_nb_chars=300) for _ in range(500)]
+
+    with transaction.atomic():
+        bulk_insert(User, (
+            User(
+                username=f'bench_{prefix}_{i}',
+                first_name=fake.first_name(),
+                last_name=fake.last_name(),
+            ) for i in range(users)
+        ))
+        user_ids = list(
+            User.objects.filter(username__startswith=f'bench_{prefix}_')
+            .values_list('pk', flat=True)
+        )
+        bulk_insert(Group, (
+            Group(
+                title=fake.sentence(nb_words=3)[:200],
+                slug=f'bench-{prefix}-{i}',
+                description=rnd.choice(texts),
+            ) for i in range(groups)
+        ))
+        group_ids = list(
+            Group.objects.filter(slug__startswith=f'bench-{prefix}-')
+            .values_list('pk', flat=True)
+        )
+        first_post = (Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0) + 1
+        bulk_insert(Post, (
+            Post(
+                author_id=rnd.choice(user_ids),
+                group_id=rnd.choice(group_ids + [None]),
+                text=rnd.choice(texts),
+            ) for _ in range(posts)
+        ))
+        last_post = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first()
+        # auto_now_add ставит всем постам одну дату; разносим их по году.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                SPREAD_PUB_DATE_SQL, [PUB_DATE_SPAN, first_post, last_post]
+            )
+        bulk_insert(Comment, (
+            Comment(
+                post_id=rnd.randint(first_post, last_post),
+                author_id=rnd.choice(user_ids),
+                text=rnd.choice(texts)[:200],
+            ) for _ in range(comments)
+        ))
+        pairs = set()
+        while len(pairs) < min(follows, users * (users - 1)):
+            user_id, author_id = rnd.sample(user_ids, 2)
+            pairs.add((user_id, author_id))
+        bulk_insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        ))
+        counters.rebuild()
+        timeline.rebuild()
+    return {
+        'users': user_ids,
+        'groups': group_ids,
+        'posts': (first_post, last_post),
+    }
+
+
+def seed_posts(posts):
+    """Набор данных с пропорциями, близкими к боевым, на posts постов."""
+    return seed(
+        users=max(posts // 100, 10),
+        groups=max(posts // 1000, 2),
+        posts=posts,
+        comments=posts,
+        follows=posts // 10,
+    )
+
+
+def pick_targets():
+    """Самые тяжёлые автор, читатель, группа и пост в базе."""
+    def heaviest(queryset, relation):
+        return (
+            queryset.annotate(total=Count(relation))
+            .order_by('-total').first()
+        )
+    return {
+        'author': heaviest(User.objects.all(), 'posts'),
+        'reader': heaviest(User.objects.all(), 'timeline'),
+        'group': heaviest(Group.objects.all(), 'posts'),
+        'post': heaviest(Post.objects.all(), 'comments'),
+    }
+
+
+def feed_querysets(user, group, author, post):
+    """Запросы, которые выполняют представления лент, и их пагинаторы."""
+    return {
+        'index': CursorPaginator(Post.objects.all(), PER_PAGE),
+        'group_posts': CursorPaginator(group.posts.all(), PER_PAGE),
+        'profile': CursorPaginator(author.posts.all(), PER_PAGE),
+        'follow_index': CursorPaginator(
+            TimelineEntry.objects.filter(user=user), PER_PAGE,
+            pk_field='post_id',
+        ),
+        'post_detail': CursorPaginator(
+            post.comments.all(), PER_PAGE, date_field='created',
+        ),
+    }
+
+
+def page_query(paginator, depth=0):
+    """Запрос страницы на глубине depth строк, как его строит курсор."""
+    queryset = paginator.object_list
+    if depth:
+        position = queryset.values_list(
+            paginator.date_field, paginator.pk_field
+        )[depth:depth + 1]
+        if position:
+            queryset = queryset.filter(
+                paginator.keyset_condition(NEXT, position[0])
+            )
+    return queryset[:paginator.per_page + 1]
+
+
+def explain(queryset, label=''):
+    sql, params = queryset.query.sql_with_params()
+    # Метка делает текст запроса уникальным: sqlite3 кеширует
+    # подготовленные EXPLAIN и не перестраивает их после DROP INDEX.
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN /* {label} */ ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {
+        'p50': round(statistics.median(samples), 3),
+        'p95': round(samples[max(int(len(samples) * 0.95) - 1, 0)], 3),
+    }
+
+
+def timings(queryset, repeat=20):
+    """Время выполнения запроса в миллисекундах: медиана и p95."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset._chain())
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+def view_urls(targets):
+    return {
+        'index': reverse('posts:index'),
+        'group_posts': reverse(
+            'posts:group_posts', args=[targets['group'].slug]
+        ),
+        'profile': reverse(
+            'posts:profile', args=[targets['author'].username]
+        ),
+        'post_detail': reverse(
+            'posts:post_detail', args=[targets['post'].pk]
+        ),
+        'follow_index': reverse('posts:follow_index'),
+    }
+
+
+def measure_views(sizes, requests=20, cold=False):
+    """Засевает базу до каждого из размеров и замеряет представления.
+
+    Возвращает словарь ``{размер: {представление: {p50, p95, queries}}}``:
+    время в миллисекундах и наибольшее число SQL-запросов за запрос.
+    С ``cold=True`` кеш очищается перед каждым запросом.
+    """
+    report = {}
+    seeded = 0
+    client = Client()
+    for size in sorted(sizes):
+        if size > seeded:
+            seed_posts(size - seeded)
+            seeded = size
+        targets = pick_targets()
+        client.force_login(targets['reader'])
+        results = {}
+        for name, url in view_urls(targets).items():
+            samples = []
+            queries = 0
+            for _ in range(requests):
+                if cold:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    samples.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    raise RuntimeError(
+                        f'{url} ответил {response.status_code}'
+                    )
+                queries = max(queries, len(context))
+            results[name] = dict(percentiles(samples), queries=queries)
+        report[size] = results
+    return report
+
+
+def drop_feed_indexes():
+    """Удаляет индексы лент; вызывать внутри транзакции с откатом."""
+    with connection.cursor() as cursor:
+        for name in FEED_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+def concurrency_profiles():
+    """Профили базы для сравнения: PRAGMA и CONN_MAX_AGE."""
+    return {
+        # Журнал отката и новое соединение на каждый запрос.
+        'default': ({'journal_mode': 'DELETE'}, 0),
+        'production': (settings.SQLITE_PRODUCTION_PRAGMAS, 600),
+    }
+
+
+def use_database(path, conn_max_age):
+    """Переключает соединение default этого процесса на файл path."""
+    connections.close_all()
+    connection.settings_dict.update(NAME=path, CONN_MAX_AGE=conn_max_age)
+
+
+def prepare_database(path, posts):
+    """Создаёт во временном файле схему и набор данных."""
+    saved = {
+        key: connection.settings_dict[key]
+        for key in ('NAME', 'CONN_MAX_AGE')
+    }
+    use_database(path, 0)
+    try:
+        call_command('migrate', verbosity=0)
+        return seed_posts(posts)
+    finally:
+        connections.close_all()
+        connection.settings_dict.update(saved)
+
+
+def concurrency_worker(task):
+    """Процесс нагрузки: читает страницы или пишет комментарии.
+
+    Сервер закрывает устаревшие соединения после каждого запроса,
+    тестовый клиент - нет, поэтому ``close_old_connections`` вызывается
+    явно: только так CONN_MAX_AGE влияет на замер.
+    """
+    role, path, pragmas, conn_max_age, duration, data, seed = task
+    rnd = random.Random(seed)
+    first_post, last_post = data['posts']
+    latencies = []
+    errors = 0
+    with override_settings(CACHES=LOCAL_CACHES, SQLITE_PRAGMAS=pragmas):
+        use_database(path, conn_max_age)
+        client = Client()
+        client.force_login(User.objects.get(pk=rnd.choice(data['users'])))
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            post_id = rnd.randint(first_post, last_post)
+            started = time.perf_counter()
+            try:
+                if role == WRITE:
+                    client.post(
+                        reverse('posts:add_comment', args=[post_id]),
+                        {'text': 'Комментарий под нагрузкой'},
+                    )
+                else:
+                    client.get(reverse('posts:post_detail', args=[post_id]))
+            except OperationalError:
+                errors += 1
+            else:
+                latencies.append((time.perf_counter() - started) * 1000)
+            finally:
+                close_old_connections()
+        connections.close_all()
+    return role, latencies, errors
+
+
+def summarize_concurrency(results, duration):
+    summary = {}
+    for role in (READ, WRITE):
+        latencies = [
+            sample for kind, samples, _ in results if kind == role
+            for sample in samples
+        ]
+        summary[role] = dict(
+            percentiles(latencies) if latencies else {},
+            per_second=round(len(latencies) / duration, 1),
+            errors=sum(errors for kind, _, errors in results if kind == role),
+        )
+    return summary
+
+
+def measure_concurrency(posts=2000, readers=4, writers=2, duration=5.0):
+    """Пропускная способность чтения и записи в каждом профиле базы.
+
+    Каждый профиль получает копию одного и того же файла базы и
+    readers + writers процессов, которые duration секунд открывают
+    страницы постов и оставляют комментарии. Возвращает словарь
+    ``{профиль: {read|write: {p50, p95, per_second, errors}}}``.
+    """
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        base = os.path.join(directory, 'base.sqlite3')
+        data = prepare_database(base, posts)
+        for name, (pragmas, conn_max_age) in concurrency_profiles().items():
+            path = os.path.join(directory, f'{name}.sqlite3')
+            shutil.copyfile(base, path)
+            roles = [READ] * readers + [WRITE] * writers
+            tasks = [
+                (role, path, pragmas, conn_max_age, duration, data, seed)
+                for seed, role in enumerate(roles)
+            ]
+            close_connections()
+            context = multiprocessing.get_context('fork')
+            with context.Pool(len(tasks)) as pool:
+                results = pool.map(concurrency_worker, tasks)
+            report[name] = summarize_concurrency(results, duration)
+    return report
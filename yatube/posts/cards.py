@@ -0,0 +1,58 @@
+"""Кеш отрендеренных карточек постов для всех лент.
+
+Карточка ``includes/posts.html`` одинакова на главной, в группе, в
+профиле, в подписках и в поиске, поэтому кешируется отдельно от
+страницы по ключу из id поста, ``updated_at`` и версии шаблона. Все
+карточки страницы читаются одним ``get_many``, недостающие
+дописываются одним ``set_many``.
+"""
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+TEMPLATE = 'includes/posts.html'
+# Шаблоны, из которых собирается карточка: их правка меняет ключи.
+TEMPLATES = (TEMPLATE, 'includes/picture.html')
+TIMEOUT = getattr(settings, 'CARD_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+@lru_cache(maxsize=None)
+def template_version():
+    """Хеш исходников шаблонов: после выкладки новой вёрстки ключи другие."""
+    digest = hashlib.md5()
+    for name in TEMPLATES:
+        digest.update(get_template(name).template.source.encode())
+    return digest.hexdigest()[:8]
+
+
+def card_key(post):
+    # Имя автора в карточке меняется без изменения поста.
+    author = hashlib.md5(post.author.get_full_name().encode()).hexdigest()
+    return 'card:{}:{}:{}:{}:{}'.format(
+        post.pk, post.updated_at.timestamp(), template_version(),
+        get_language(), author[:8],
+    )
+
+
+def render_card(post):
+    return render_to_string(TEMPLATE, {'post': post})
+
+
+def get_cards(posts):
+    """Пары (пост, html карточки) в порядке posts."""
+    posts = list(posts)
+    keys = {post.pk: card_key(post) for post in posts}
+    cards = cache.get_many(keys.values())
+    missing = {
+        keys[post.pk]: render_card(post)
+        for post in posts if keys[post.pk] not in cards
+    }
+    if missing:
+        cache.set_many(missing, TIMEOUT)
+        cards.update(missing)
+    return [(post, mark_safe(cards[keys[post.pk]])) for post in posts]
@@ -0,0 +1,48 @@
+"""Постраничная загрузка комментариев к посту.
+
+Комментарии идут от новых к старым страницами по COMMENTS_PER_PAGE через
+тот же keyset-пагинатор, что и ленты, поэтому страница поста не растёт
+с числом комментариев. Первая страница рендерится один раз и лежит в
+кеше, пока к посту не добавят или не удалят комментарий.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.paginator import CursorPaginator
+from .models import Comment
+
+PER_PAGE = getattr(settings, 'COMMENTS_PER_PAGE', 20)
+TIMEOUT = getattr(settings, 'COMMENTS_CACHE_TIMEOUT', 60 * 60 * 24)
+FIRST_PAGE_KEY = 'comments:{}'
+TEMPLATE = 'includes/comments.html'
+
+
+def get_page(post_id, cursor=None):
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    )
+    paginator = CursorPaginator(comments, PER_PAGE, date_field='created')
+    return paginator.get_page(cursor=cursor)
+
+
+def render_page(post_id, cursor=None):
+    return render_to_string(TEMPLATE, {
+        'comments': get_page(post_id, cursor),
+        'post_id': post_id,
+    })
+
+
+def first_page(post_id):
+    """HTML первой страницы комментариев из кеша."""
+    key = FIRST_PAGE_KEY.format(post_id)
+    html = cache.get(key)
+    if html is None:
+        html = render_page(post_id)
+        cache.set(key, html, TIMEOUT)
+    return mark_safe(html)
+
+
+def invalidate(post_id):
+    cache.delete(FIRST_PAGE_KEY.format(post_id))
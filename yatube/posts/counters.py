@@ -0,0 +1,99 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются атомарными ``F()``-обновлениями из сигналов, поэтому
+чтение ничего не стоит. Массовые операции в обход сигналов
+(``bulk_create``, ``QuerySet.update``) счётчики не трогают - расхождения
+исправляет команда ``manage.py rebuild_counters``. Она же пересчитывает
+ссылки постов на файлы картинок в хранилище.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.storage import content_storage
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def increment(queryset, field, delta=1):
+    if delta < 0:
+        # Счётчик не уходит в минус даже после расхождения с данными.
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump_user(user_id, field, delta=1):
+    if user_id is None:
+        return
+    stats = UserStats.objects.filter(user_id=user_id)
+    if not increment(stats, field, delta) and delta > 0:
+        # Строки статистики ещё нет: создаём и повторяем обновление.
+        if User.objects.filter(pk=user_id).exists():
+            UserStats.objects.get_or_create(user_id=user_id)
+            increment(stats, field, delta)
+
+
+def bump_group(group_id, delta=1):
+    if group_id is not None:
+        increment(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def bump_post(post_id, delta=1):
+    increment(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def get_stats(user):
+    """Статистика пользователя; отсутствующая строка создаётся."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(user=user)
+        return stats
+
+
+def count_of(model, field):
+    """Подзапрос COUNT(*) строк model, ссылающихся на внешнюю строку."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+COUNTERS = (
+    (Post, 'comments_count', count_of(Comment, 'post')),
+    (Group, 'posts_count', count_of(Post, 'group')),
+    (UserStats, 'posts_count', count_of(Post, 'author')),
+    (UserStats, 'comments_count', count_of(Comment, 'author')),
+    (UserStats, 'followers_count', count_of(Follow, 'author')),
+    (UserStats, 'following_count', count_of(Follow, 'user')),
+)
+
+
+def rebuild():
+    """Пересчитывает все счётчики и возвращает число исправленных строк."""
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True
+    )
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in missing.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    fixed = {}
+    for model, field, actual in COUNTERS:
+        label = f'{model._meta.model_name}.{field}'
+        fixed[label] = (
+            model.objects.exclude(**{field: actual})
+            .update(**{field: actual})
+        )
+    fixed['storedfile.refs'] = content_storage.rebuild_refs(image_refs())
+    return fixed
+
+
+def image_refs():
+    """Пары (файл картинки, число постов с ним)."""
+    return (
+        Post.objects.exclude(image='').order_by()
+        .values_list('image').annotate(refs=Count('pk'))
+    )
@@ -0,0 +1,143 @@
+"""Фоновое удаление пользователей, групп и постов пачками.
+
+Каскадное удаление автора с тысячами постов одним запросом держит
+блокировку записи SQLite всё время каскада. Вместо этого объект только
+помечается (пост и группа - ``is_deleted``, пользователь -
+``UserStats.is_deleted``) и ставится в очередь ``DeletionJob``, а команда
+``manage.py process_deletions`` удаляет связанные строки пачками, каждую
+в своей короткой транзакции. Пачки удаляются через ORM, поэтому сигналы
+поддерживают счётчики, ленты и кеши как при обычном удалении и снимают
+ссылки на картинки: файл, на который больше никто не ссылается,
+стирается вместе с миниатюрами.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .counters import get_stats
+from .models import (
+    Comment, DeletionJob, Follow, Group, Post, TimelineEntry, User
+)
+from .signals import touch_posts
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'DELETION_BATCH_SIZE', 500)
+MAX_ATTEMPTS = getattr(settings, 'DELETION_MAX_ATTEMPTS', 3)
+
+# Тип задачи для каждой модели.
+KINDS = {
+    User: DeletionJob.USER,
+    Group: DeletionJob.GROUP,
+    Post: DeletionJob.POST,
+}
+
+
+def schedule(obj):
+    """Помечает объект удаляемым и ставит его в очередь.
+
+    Пометка пользователя хранится в ``UserStats``: ``is_active`` только
+    закрывает вход, и посты заблокированного автора остаются на сайте.
+    """
+    kind = KINDS[type(obj)]
+    marked = obj
+    if kind == DeletionJob.USER:
+        obj.is_active = False
+        obj.save(update_fields=['is_active'])
+        marked = get_stats(obj)
+    marked.is_deleted = True
+    # save(), а не update(): сигналы сбросят кеши страниц объекта.
+    marked.save(update_fields=['is_deleted'])
+    DeletionJob.objects.get_or_create(kind=kind, object_id=obj.pk)
+
+
+def delete_rows(queryset, size):
+    pks = list(queryset.values_list('pk', flat=True)[:size])
+    if pks:
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def detach_posts(queryset, size):
+    pks = list(queryset.values_list('pk', flat=True)[:size])
+    return touch_posts(Post.objects.filter(pk__in=pks), group=None)
+
+
+def user_steps(pk):
+    # Сначала записи лент и комментарии: тогда удаление подписок и
+    # постов не тянет за собой каскад.
+    return (
+        (delete_rows, TimelineEntry.objects.filter(
+            Q(user_id=pk) | Q(post__author_id=pk)
+        )),
+        (delete_rows, Comment.objects.filter(
+            Q(author_id=pk) | Q(post__author_id=pk)
+        )),
+        (delete_rows, Follow.objects.filter(
+            Q(user_id=pk) | Q(author_id=pk)
+        )),
+        (delete_rows, Post.objects.filter(author_id=pk)),
+        (delete_rows, User.objects.filter(pk=pk)),
+    )
+
+
+def group_steps(pk):
+    return (
+        (detach_posts, Post.objects.filter(group_id=pk)),
+        (delete_rows, Group.objects.filter(pk=pk)),
+    )
+
+
+def post_steps(pk):
+    return (
+        (delete_rows, TimelineEntry.objects.filter(post_id=pk)),
+        (delete_rows, Comment.objects.filter(post_id=pk)),
+        (delete_rows, Post.objects.filter(pk=pk)),
+    )
+
+
+STEPS = {
+    DeletionJob.USER: user_steps,
+    DeletionJob.GROUP: group_steps,
+    DeletionJob.POST: post_steps,
+}
+
+
+def run_batch(job, size=BATCH_SIZE):
+    """Удаляет очередную пачку задачи и возвращает число строк.
+
+    Шаги каждый раз проверяются с начала: пока идёт удаление, сайт
+    доступен на запись, и к объекту могут добавиться новые строки.
+    Когда удалять больше нечего, задача снимается с очереди.
+    """
+    for action, queryset in STEPS[job.kind](job.object_id):
+        count = action(queryset, size)
+        if count:
+            return count
+    job.delete()
+    return 0
+
+
+def process(job_id, size=BATCH_SIZE):
+    job = DeletionJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return 0
+    try:
+        return run_batch(job, size)
+    except Exception as error:
+        logger.exception('Ошибка удаления %s', job)
+        DeletionJob.objects.filter(pk=job.pk).update(
+            attempts=job.attempts + 1, error=str(error)
+        )
+        return 0
+
+
+def pending_jobs(limit):
+    return list(
+        DeletionJob.objects.filter(attempts__lt=MAX_ATTEMPTS)
+        .order_by('pk')
+        .values_list('pk', flat=True)[:limit]
+    )
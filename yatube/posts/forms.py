@@ -1,6 +1,6 @@
 from django import forms
 
-from .models import Post, Comment
+from .models import Comment, Group, Post
 
 
 class PostForm(forms.ModelForm):
@@ -18,6 +18,12 @@ class PostForm(forms.ModelForm):
             'image': 'Загрузите изображение',
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['group'].queryset = Group.objects.filter(
+            is_deleted=False
+        )
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,72 @@
+from multiprocessing import Pool
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Case, TextField, Value, When
+
+from core import images
+from core.db import close_connections
+from posts.models import Post
+from posts.signals import touch_posts
+
+
+def read_placeholder(name):
+    """Вызывается в дочернем процессе: только чтение файла, без базы."""
+    try:
+        with default_storage.open(name) as file:
+            return name, images.read_placeholder(file), None
+    except Exception as error:
+        return name, None, str(error)
+
+
+class Command(BaseCommand):
+    help = 'Считает превью-заглушки для картинок существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=4,
+            help='Размер пула процессов, декодирующих картинки',
+        )
+        parser.add_argument(
+            '--batch', type=int, default=500,
+            help='Сколько картинок обновлять в базе за раз',
+        )
+
+    def handle(self, *args, **options):
+        names = list(
+            Post.objects.exclude(image='')
+            .filter(image_placeholder='')
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+            .iterator()
+        )
+        close_connections()
+        done = failed = 0
+        batch = []
+        with Pool(options['processes'], initializer=close_connections) as pool:
+            for name, placeholder, error in pool.imap_unordered(
+                read_placeholder, names, chunksize=16
+            ):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+                    continue
+                batch.append((name, placeholder))
+                if len(batch) == options['batch']:
+                    done += self.save(batch)
+                    batch = []
+            done += self.save(batch)
+        self.stdout.write(f'Обработано: {done}, с ошибками: {failed}')
+
+    def save(self, batch):
+        if batch:
+            # Одно обновление на пачку: превью выбирается по имени файла.
+            touch_posts(
+                Post.objects.filter(image__in=[name for name, _ in batch]),
+                image_placeholder=Case(*(
+                    When(image=name, then=Value(placeholder))
+                    for name, placeholder in batch
+                ), output_field=TextField()),
+            )
+        return len(batch)
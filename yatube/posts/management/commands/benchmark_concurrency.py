@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность чтения и записи при '
+        'одновременной нагрузке в профилях базы default и production; '
+        'данные создаются во временном файле'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=2000,
+            help='Размер набора данных в постах',
+        )
+        parser.add_argument(
+            '--readers', type=int, default=4,
+            help='Число процессов, читающих страницы постов',
+        )
+        parser.add_argument(
+            '--writers', type=int, default=2,
+            help='Число процессов, оставляющих комментарии',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=5.0,
+            help='Длительность нагрузки на профиль в секундах',
+        )
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        report = benchmark.measure_concurrency(
+            options['posts'], options['readers'], options['writers'],
+            options['duration'],
+        )
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        self.stdout.write(data)
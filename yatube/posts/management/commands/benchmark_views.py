@@ -0,0 +1,50 @@
+import json
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Засевает базу данными нескольких размеров и выводит в JSON '
+        'p50/p95 времени ответа и число SQL-запросов для каждой ленты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1000, 10000],
+            help='Размеры набора данных в постах',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=20,
+            help='Сколько раз запрашивать каждую страницу',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Сохранить созданные данные; по умолчанию всё '
+                 'откатывается',
+        )
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            report = benchmark.measure_views(
+                options['sizes'], options['requests'], options['cold']
+            )
+            if not options['keep']:
+                transaction.set_rollback(True)
+        if not options['keep']:
+            # В общем кеше остались фрагменты откаченных данных.
+            cache.clear()
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(data)
+        self.stdout.write(data)
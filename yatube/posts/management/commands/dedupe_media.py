@@ -0,0 +1,64 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from core import thumbnails
+from core.storage import content_storage, file_digest, hashed_name
+from posts import counters
+from posts.models import Post
+from posts.signals import touch_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Переименовывает картинки постов по хешу содержимого, удаляет '
+        'дубликаты и пересчитывает ссылки на файлы'
+    )
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image='').order_by()
+            .values_list('image', flat=True).distinct()
+        )
+        moved = duplicates = reclaimed = 0
+        for name in list(names.iterator()):
+            if not content_storage.exists(name):
+                self.stderr.write(f'{name}: файл не найден')
+                continue
+            target, size, existed = self.link(name)
+            if target == name:
+                continue
+            self.rename(name, target)
+            if existed:
+                duplicates += 1
+                reclaimed += size
+            else:
+                moved += 1
+                thumbnails.enqueue(target)
+        content_storage.rebuild_refs(counters.image_refs())
+        self.stdout.write(
+            f'Переименовано: {moved}, дубликатов удалено: {duplicates}, '
+            f'освобождено: {filesizeformat(reclaimed)}'
+        )
+
+    def link(self, name):
+        """Жёсткая ссылка на файл под именем по хешу.
+
+        Возвращает (новое имя, размер, существовал ли уже такой файл).
+        Старое имя остаётся рабочим, пока посты не переписаны на новое.
+        """
+        with content_storage.open(name) as file:
+            target = hashed_name(name, file_digest(file))
+        size = content_storage.size(name)
+        existed = content_storage.exists(target)
+        if not existed:
+            path = content_storage.path(target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.link(content_storage.path(name), path)
+        return target, size, existed
+
+    def rename(self, name, target):
+        touch_posts(Post.objects.filter(image=name), image=target)
+        # Старый файл и его миниатюры больше не нужны.
+        thumbnails.delete(name)
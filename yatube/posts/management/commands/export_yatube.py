@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает пользователей, группы, посты, комментарии и подписки '
+        'в JSON Lines'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл выгрузки; .gz - со сжатием, - - stdout',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=transfer.CHUNK_SIZE,
+            help='Сколько строк читать из базы за раз',
+        )
+
+    def handle(self, *args, **options):
+        progress = transfer.Progress(self.stderr.write)
+        stream = transfer.open_dump(options['path'], 'w')
+        try:
+            transfer.export(stream, progress, options['chunk_size'])
+        finally:
+            if options['path'] != '-':
+                stream.close()
+        self.stderr.write(self.style.SUCCESS('Выгрузка завершена'))
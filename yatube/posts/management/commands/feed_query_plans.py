@@ -0,0 +1,58 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы и время запросов лент; с --compare - то же '
+        'самое без индексов лент для сравнения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Сначала создать столько постов (и пропорционально '
+                 'остальных данных)',
+        )
+        parser.add_argument(
+            '--depth', type=int, default=1000,
+            help='Глубина «дальней» страницы в строках',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--compare', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            benchmark.seed_posts(options['seed'])
+        report = {'with_indexes': self.measure(options, 'with_indexes')}
+        if options['compare']:
+            with transaction.atomic():
+                benchmark.drop_feed_indexes()
+                report['without_indexes'] = self.measure(
+                    options, 'without_indexes'
+                )
+                transaction.set_rollback(True)
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+    def measure(self, options, label):
+        targets = benchmark.pick_targets()
+        if None in targets.values():
+            self.stderr.write('Недостаточно данных, запустите с --seed')
+            return {}
+        paginators = benchmark.feed_querysets(
+            targets['reader'], targets['group'],
+            targets['author'], targets['post'],
+        )
+        result = {}
+        for name, paginator in paginators.items():
+            for page, depth in (('first', 0), ('deep', options['depth'])):
+                queryset = benchmark.page_query(paginator, depth)
+                result[f'{name}:{page}'] = {
+                    'plan': benchmark.explain(queryset, label),
+                    'ms': benchmark.timings(queryset, options['repeat']),
+                }
+        return result
@@ -0,0 +1,41 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = 'Загружает выгрузку export_yatube в текущую базу'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл выгрузки; .gz - со сжатием, - - stdin',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=transfer.BATCH_SIZE,
+            help='Строк в одной транзакции bulk_create',
+        )
+        parser.add_argument(
+            '--media', metavar='DIR',
+            help='MEDIA_ROOT источника: скопировать картинки постов',
+        )
+
+    def handle(self, *args, **options):
+        importer = transfer.Importer(
+            transfer.Progress(self.stdout.write),
+            batch_size=options['batch_size'],
+            media_root=options['media'],
+        )
+        stream = transfer.open_dump(options['path'], 'r')
+        try:
+            importer.run(stream)
+        finally:
+            if options['path'] != '-':
+                stream.close()
+        for label, count in importer.skipped.items():
+            self.stdout.write(f'{label}: пропущено без связей {count}')
+        # Загрузка шла в обход сигналов: кешированные страницы устарели.
+        cache.clear()
+        self.stdout.write(self.style.SUCCESS(
+            'Загрузка завершена. Миниатюры: manage.py warm_thumbnails'
+        ))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from core import images, thumbnails
+from core.storage import content_storage
+from posts.models import Post
+from posts.signals import release_images, touch_posts
+
+
+class Command(BaseCommand):
+    help = (
+        'Нормализует картинки постов, загруженные до обработки при '
+        'загрузке, и записывает их размеры'
+    )
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image='')
+            .filter(image_width__isnull=True)
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        done = failed = 0
+        for name in list(names.iterator()):
+            try:
+                self.normalize(name)
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{name}: {error}')
+            else:
+                done += 1
+        self.stdout.write(f'Обработано: {done}, с ошибками: {failed}')
+
+    def normalize(self, name):
+        posts = Post.objects.filter(image=name)
+        with content_storage.open(name) as file:
+            normalized = images.normalize(file)
+            new_name = name
+            if normalized.file is not file:
+                new_name = content_storage.save(
+                    'posts/' + normalized.file.name, normalized.file
+                )
+        count = touch_posts(
+            posts,
+            image=new_name,
+            image_width=normalized.width,
+            image_height=normalized.height,
+            image_size=normalized.size,
+            image_placeholder=normalized.placeholder,
+        )
+        if new_name != name:
+            # save() добавил одну ссылку, остальные - у других постов.
+            content_storage.retain(new_name, count=count - 1)
+            release_images(*[name] * count)
+            thumbnails.enqueue(new_name)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import deletion
+
+
+class Command(BaseCommand):
+    help = 'Удаляет пачками объекты из очереди DeletionJob'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch', type=int, default=deletion.BATCH_SIZE,
+            help='Сколько строк удалять в одной транзакции',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.05,
+            help='Пауза между пачками, чтобы пропустить другие записи',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Не завершаться, а ждать новых задач',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=2.0,
+            help='Пауза между опросами очереди в режиме --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = deletion.pending_jobs(10)
+            if not jobs:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+            for job_id in jobs:
+                self.drain(job_id, options['batch'], options['pause'])
+        self.stdout.write(self.style.SUCCESS('Очередь удаления пуста'))
+
+    def drain(self, job_id, batch, pause):
+        deleted = 0
+        while True:
+            count = deletion.process(job_id, batch)
+            if not count:
+                break
+            deleted += count
+            time.sleep(pause)
+        self.stdout.write(f'Задача {job_id}: удалено строк {deleted}')
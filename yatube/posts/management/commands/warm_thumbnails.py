@@ -0,0 +1,35 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from core import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь миниатюры для уже существующих постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=0,
+            help='Сразу сгенерировать миниатюры пулом из N процессов',
+        )
+
+    def handle(self, *args, **options):
+        images = (
+            Post.objects.exclude(image='')
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        missing = []
+        for name in images.iterator():
+            if not thumbnails.is_complete(name):
+                missing.append(name)
+        thumbnails.enqueue(*missing)
+        self.stdout.write(f'Поставлено в очередь: {len(missing)}')
+        if options['processes']:
+            call_command(
+                'process_thumbnails',
+                processes=options['processes'],
+                stdout=self.stdout,
+            )
@@ -0,0 +1,70 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+FILL_COUNTERS_SQL = [
+    '''
+    UPDATE posts_post SET comments_count = (
+        SELECT COUNT(*) FROM posts_comment
+        WHERE posts_comment.post_id = posts_post.id
+    )
+    ''',
+    '''
+    UPDATE posts_group SET posts_count = (
+        SELECT COUNT(*) FROM posts_post
+        WHERE posts_post.group_id = posts_group.id
+    )
+    ''',
+    '''
+    INSERT INTO posts_userstats (
+        user_id, posts_count, comments_count,
+        followers_count, following_count
+    )
+    SELECT
+        auth_user.id,
+        (SELECT COUNT(*) FROM posts_post
+         WHERE posts_post.author_id = auth_user.id),
+        (SELECT COUNT(*) FROM posts_comment
+         WHERE posts_comment.author_id = auth_user.id),
+        (SELECT COUNT(*) FROM posts_follow
+         WHERE posts_follow.author_id = auth_user.id),
+        (SELECT COUNT(*) FROM posts_follow
+         WHERE posts_follow.user_id = auth_user.id)
+    FROM auth_user
+    ''',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0012_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('comments_count', models.PositiveIntegerField(default=0)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunSQL(FILL_COUNTERS_SQL, migrations.RunSQL.noop),
+    ]
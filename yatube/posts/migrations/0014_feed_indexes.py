@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+# Дубликаты подписок мешают создать уникальное ограничение; счётчики
+# подписок после их удаления пересчитываются.
+DEDUPLICATE_FOLLOWS_SQL = [
+    '''
+    DELETE FROM posts_follow WHERE id NOT IN (
+        SELECT MIN(id) FROM posts_follow GROUP BY user_id, author_id
+    )
+    ''',
+    '''
+    UPDATE posts_userstats SET
+        followers_count = (
+            SELECT COUNT(*) FROM posts_follow
+            WHERE posts_follow.author_id = posts_userstats.user_id
+        ),
+        following_count = (
+            SELECT COUNT(*) FROM posts_follow
+            WHERE posts_follow.user_id = posts_userstats.user_id
+        )
+    ''',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date_idx'),
+        ),
+        migrations.RunSQL(DEDUPLICATE_FOLLOWS_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='follow_unique_user_author'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:23
+
+import core.images
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_post_image_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', validators=[core.images.validate_animation], verbose_name='Картинка'),
+        ),
+    ]
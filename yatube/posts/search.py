@@ -0,0 +1,141 @@
+"""Полнотекстовый поиск по постам на индексе SQLite FTS5.
+
+Таблица ``posts_post_fts`` хранит только индекс: текст она читает из
+``posts_post`` (external content). Синхронизацию делают триггеры
+базы, поэтому индекс не отстаёт и при ``bulk_create`` или
+``QuerySet.update``, которые обходят сигналы.
+"""
+import math
+import re
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+
+from core.paginator import CursorPage
+
+from .models import Post
+
+TABLE = 'posts_post_fts'
+MAX_TERMS = 10
+MAX_PAGES = 50
+# Глубина выдачи в постах. Ранжируются все совпадения, а LIMIT страницы
+# ограничивает сортировку: SQLite держит только лучшие строки.
+MAX_RESULTS = getattr(settings, 'SEARCH_MAX_RESULTS', 500)
+
+# SQLite удаляет триггеры вместе с таблицей, а миграции Django
+# пересоздают posts_post при изменении полей. Поэтому триггеры ставятся
+# заново после каждой миграции, см. install().
+TRIGGERS = (
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_insert
+    AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id, new.text);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_delete
+    AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS {TABLE}_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {TABLE} ({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE} (rowid, text) VALUES (new.id, new.text);
+    END
+    ''',
+)
+
+MATCH_SQL = f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s'
+
+
+def install(using='default'):
+    """Ставит триггеры синхронизации, если таблица индекса существует."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [TABLE],
+        )
+        if cursor.fetchone() is None:
+            return
+        for sql in TRIGGERS:
+            cursor.execute(sql)
+
+
+def rebuild():
+    """Перестраивает индекс целиком по текущему содержимому posts_post."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def match_query(text):
+    """Запрос FTS5 из пользовательской строки или None, если искать нечего.
+
+    Каждое слово берётся в кавычки, чтобы символы синтаксиса FTS5 в
+    запросе не давали ошибку, и ищется как префикс: так находятся и
+    другие формы русских слов.
+    """
+    terms = re.findall(r'\w+', text or '')[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search(text):
+    """Посты, подходящие под запрос, от самых релевантных."""
+    query = match_query(text)
+    if query is None:
+        return Post.objects.none()
+    return Post.objects.extra(
+        tables=[TABLE],
+        where=[
+            f'{TABLE}.rowid = posts_post.id',
+            f'{TABLE} MATCH %s',
+        ],
+        params=[query],
+        select={'search_rank': f'{TABLE}.rank'},
+        order_by=['search_rank', '-pub_date'],
+    )
+
+
+def filter_posts(queryset, text):
+    """Оставляет в queryset только посты, найденные по индексу."""
+    query = match_query(text)
+    if query is None:
+        return queryset
+    return queryset.filter(pk__in=RawSQL(MATCH_SQL, [query]))
+
+
+class SearchPaginator(Paginator):
+    """Страницы выдачи поиска по релевантности.
+
+    Порядок по rank не годится для keyset-условия, поэтому курсор здесь -
+    номер страницы, а глубина выдачи ограничена MAX_PAGES страницами и
+    MAX_RESULTS постами - что наступит раньше. Страница
+    отдаёт next_cursor и previous_cursor, как у ленточного пагинатора,
+    и выводится тем же шаблоном. COUNT(*) не выполняется.
+    """
+
+    @property
+    def last_page(self):
+        return max(min(MAX_PAGES, math.ceil(MAX_RESULTS / self.per_page)), 1)
+
+    def get_page(self, number=None, cursor=None):
+        try:
+            number = min(max(int(cursor or number), 1), self.last_page)
+        except (TypeError, ValueError):
+            number = 1
+        offset = (number - 1) * self.per_page
+        rows = list(self.object_list[offset:offset + self.per_page + 1])
+        has_next = len(rows) > self.per_page and number < self.last_page
+        return CursorPage(
+            rows[:self.per_page], number, self,
+            next_cursor=str(number + 1) if has_next else None,
+            previous_cursor=str(number - 1) if number > 1 else None,
+        )
@@ -0,0 +1,248 @@
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_save
+)
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import images, thumbnails
+from core.cache import bump_version, touch
+from core.models import StoredFile
+from core.storage import content_storage
+from . import comments, counters, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+FEED_VERSION = 'feed'
+# Имена отметок изменения страниц для условного GET.
+FEED_PAGE = 'feed'
+POST_PAGE = 'post:{}'
+AUTHOR_PAGE = 'author:{}'
+GROUP_PAGE = 'group:{}'
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_feed(sender, **kwargs):
+    bump_version(FEED_VERSION)
+    touch(FEED_PAGE)
+
+
+def post_pages(post_id, author_id, *group_ids):
+    names = [POST_PAGE.format(post_id), AUTHOR_PAGE.format(author_id)]
+    names += [GROUP_PAGE.format(pk) for pk in set(group_ids) if pk]
+    return names
+
+
+def touch_posts(posts, **fields):
+    """Обновляет посты через update() и сбрасывает их кеши.
+
+    update() обходит сигналы: новый updated_at меняет ключи карточек,
+    а отметки лент и страниц постов, авторов и групп (прежних тоже)
+    сбрасывают кеш страниц. Возвращает число обновлённых постов.
+    """
+    rows = list(posts.values_list('pk', 'author_id', 'group_id'))
+    if not rows:
+        return 0
+    posts.update(updated_at=timezone.now(), **fields)
+    bump_version(FEED_VERSION)
+    touch(FEED_PAGE, *(name for row in rows for name in post_pages(*row)))
+    return len(rows)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def touch_post_pages(sender, instance, **kwargs):
+    # Вызывается до count_post_saved, пока _loaded_group_id - старая
+    # группа поста.
+    touch(*post_pages(
+        instance.pk, instance.author_id,
+        instance.group_id, instance._loaded_group_id,
+    ))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_comment_pages(sender, instance, **kwargs):
+    comments.invalidate(instance.post_id)
+    touch(POST_PAGE.format(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def touch_follow_pages(sender, instance, **kwargs):
+    touch(
+        AUTHOR_PAGE.format(instance.author_id),
+        AUTHOR_PAGE.format(instance.user_id),
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_user_pages(sender, instance, **kwargs):
+    touch(AUTHOR_PAGE.format(instance.pk))
+
+
+@receiver(post_save, sender=UserStats)
+def touch_deleted_author_pages(sender, instance, update_fields=None,
+                               **kwargs):
+    # Пометка удаления скрывает все посты автора: с главной, страниц
+    # групп и страниц самих постов. Счётчики меняются через update()
+    # и сюда не попадают.
+    if not update_fields or 'is_deleted' not in update_fields:
+        return
+    bump_version(FEED_VERSION)
+    posts = Post.objects.filter(author_id=instance.user_id)
+    touch(FEED_PAGE, AUTHOR_PAGE.format(instance.user_id), *(
+        name for post_id, group_id in posts.values_list('pk', 'group_id')
+        for name in post_pages(post_id, instance.user_id, group_id)
+    ))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def touch_group_pages(sender, instance, **kwargs):
+    touch(GROUP_PAGE.format(instance.pk))
+
+
+@receiver(thumbnails.thumbnail_ready)
+def touch_thumbnail_pages(sender, name, **kwargs):
+    touch_posts(Post.objects.filter(image=name))
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_state(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = instance.image.name
+
+
+@receiver(pre_save, sender=Post)
+def normalize_image(sender, instance, raw=False, **kwargs):
+    # Только новая загрузка: сохранённый файл уже нормализован.
+    if raw or not instance.image or instance.image._committed:
+        return
+    instance._image_uploaded = True
+    normalized = images.normalize(instance.image)
+    if normalized.file is not instance.image:
+        instance.image = normalized.file
+    instance.image_width = normalized.width
+    instance.image_height = normalized.height
+    instance.image_size = normalized.size
+    instance.image_placeholder = normalized.placeholder
+
+
+def release_images(*names):
+    """Снимает ссылки постов на картинки; ненужные файлы стираются.
+
+    Ссылки снимаются в текущей транзакции, а файлы стираются после её
+    фиксации: при откате посты не должны остаться без картинок.
+    """
+    unused = {
+        name for name in names if name and content_storage.release(name)
+    }
+    if unused:
+        transaction.on_commit(lambda: delete_unused_images(unused))
+
+
+def delete_unused_images(names):
+    # Файлы без учёта ссылок (до перехода на хранилище по хешу) могут
+    # остаться у других постов, а за время транзакции те же байты
+    # могли загрузить заново.
+    used = set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True
+    ))
+    used.update(StoredFile.objects.filter(name__in=names).values_list(
+        'name', flat=True
+    ))
+    thumbnails.delete(*set(names).difference(used))
+
+
+@receiver(post_save, sender=Post)
+def release_replaced_image(sender, instance, **kwargs):
+    # Вызывается до queue_thumbnails, пока _loaded_image - старый файл.
+    # Новая загрузка взяла свою ссылку, даже если байты те же и имя не
+    # изменилось: тогда снимается ссылка старой загрузки.
+    old = instance._loaded_image
+    uploaded = instance.__dict__.pop('_image_uploaded', False)
+    if old and (uploaded or old != instance.image.name):
+        release_images(old)
+
+
+@receiver(post_delete, sender=Post)
+def release_deleted_image(sender, instance, **kwargs):
+    release_images(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, **kwargs):
+    if instance.image and instance.image.name != instance._loaded_image:
+        thumbnails.enqueue(instance.image.name)
+    instance._loaded_image = instance.image.name
+
+
+@receiver(post_save, sender=Post)
+def count_post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count')
+        counters.bump_group(instance.group_id)
+    elif instance._loaded_group_id != instance.group_id:
+        counters.bump_group(instance._loaded_group_id, -1)
+        counters.bump_group(instance.group_id)
+    instance._loaded_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def count_post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    counters.bump_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_post(instance.post_id)
+        counters.bump_user(instance.author_id, 'comments_count')
+
+
+@receiver(post_delete, sender=Comment)
+def count_comment_deleted(sender, instance, **kwargs):
+    counters.bump_post(instance.post_id, -1)
+    counters.bump_user(instance.author_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user(instance.author_id, 'followers_count')
+        counters.bump_user(instance.user_id, 'following_count')
+
+
+@receiver(post_delete, sender=Follow)
+def count_follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    counters.bump_user(instance.user_id, 'following_count', -1)
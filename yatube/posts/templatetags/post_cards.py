@@ -0,0 +1,11 @@
+from django import template
+
+from ..cards import get_cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Карточки постов страницы из кеша, одним запросом к нему."""
+    return get_cards(posts)
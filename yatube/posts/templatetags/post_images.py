@@ -0,0 +1,34 @@
+from django import template
+from django.conf import settings
+
+from core.thumbnails import picture
+
+register = template.Library()
+
+# Ширина картинки на странице: вся колонка на телефоне, не больше 960px
+# на широком экране.
+SIZES = getattr(
+    settings, 'THUMBNAIL_SIZES', '(min-width: 992px) 960px, 100vw'
+)
+
+
+@register.inclusion_tag('includes/picture.html')
+def post_picture(image, lazy=True):
+    """``<picture>`` с вариантами миниатюр или исходник, пока их нет.
+
+    Размеры исходника и превью-заглушка берутся из поста, а не из
+    файла: заглушка видна фоном, пока грузится картинка. lazy=False - для
+    картинки на первом экране, которую браузер должен грузить сразу.
+    """
+    post = image.instance
+    result = picture(image)
+    if result and not result.ready:
+        result = result._replace(
+            width=post.image_width, height=post.image_height
+        )
+    return {
+        'picture': result,
+        'placeholder': post.image_placeholder,
+        'sizes': SIZES,
+        'lazy': lazy,
+    }
@@ -1,6 +1,11 @@
+import hashlib
+import io
 import shutil
 import tempfile
 from datetime import date
+from io import StringIO
+
+from PIL import Image
 
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
@@ -8,8 +13,13 @@ from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 
+from core.cache import get_version
+from ..cards import card_key
 from ..models import Group, Post, Comment
+from ..signals import FEED_VERSION
 from ..forms import PostForm
 
 
@@ -78,15 +88,90 @@ class PostFormTest(TestCase):
         self.assertRedirects(response, reverse(
             'posts:profile', kwargs={'username': f'{self.post.author}'}
         ))
+        digest = hashlib.sha256(small_gif).hexdigest()
         self.assertTrue(
             Post.objects.filter(
                 author=self.user,
                 text='Дополнительный Тестовый пост',
                 group=self.group.id,
-                image='posts/small.gif'
+                image=f'posts/{digest[:2]}/{digest}.gif'
             ).exists()
         )
 
+    def test_large_photo_is_normalized(self):
+        """Фото уменьшается, теряет EXIF, а размеры пишутся в пост"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        photo = io.BytesIO()
+        Image.new('RGB', (3000, 1500), 'red').save(photo, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile(
+            'photo.jpeg', photo.getvalue(), content_type='image/jpeg'
+        )
+        self.authorized_client.post(reverse('posts:post_create'), {
+            'text': 'Пост с фото',
+            'image': uploaded,
+        })
+        post = Post.objects.get(text='Пост с фото')
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w{64}\.jpg$')
+        self.assertEqual((post.image_width, post.image_height), (2048, 1024))
+        self.assertEqual(
+            post.image_size, default_storage.size(post.image.name)
+        )
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (2048, 1024))
+            self.assertFalse(image.getexif())
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/png;base64,')
+        )
+        self.assertContains(
+            self.guest.get(reverse('posts:index')), post.image_placeholder
+        )
+
+    def test_placeholders_backfilled(self):
+        """Команда дозаполняет превью старых постов и сбрасывает карточки"""
+        content = io.BytesIO()
+        Image.new('RGB', (40, 20), 'green').save(content, 'PNG')
+        post = Post.objects.create(
+            author=self.user, text='Старый пост',
+            image=SimpleUploadedFile('old.png', content.getvalue()),
+        )
+        placeholder = post.image_placeholder
+        Post.objects.filter(pk=post.pk).update(image_placeholder='')
+        post.refresh_from_db()
+        key = card_key(post)
+        version = get_version(FEED_VERSION)
+        call_command(
+            'backfill_placeholders', processes=1, batch=1, stdout=StringIO()
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.image_placeholder, placeholder)
+        self.assertNotEqual(card_key(post), key)
+        self.assertNotEqual(get_version(FEED_VERSION), version)
+
+    def test_large_animation_is_rejected(self):
+        """Анимация больше IMAGE_MAX_SIZE не проходит валидацию"""
+        frames = [
+            Image.new('P', (3000, 10), color) for color in (0, 1)
+        ]
+        animation = io.BytesIO()
+        frames[0].save(
+            animation, 'GIF', save_all=True, append_images=frames[1:]
+        )
+        response = self.authorized_client.post(
+            reverse('posts:post_create'), {
+                'text': 'Тяжёлая анимация',
+                'image': SimpleUploadedFile('cat.gif', animation.getvalue()),
+            }
+        )
+        self.assertFormError(
+            response, 'form', 'image',
+            'Анимация должна быть не больше 2048 пикселей по большей '
+            'стороне и 4 МБ.',
+        )
+        self.assertFalse(
+            Post.objects.filter(text='Тяжёлая анимация').exists()
+        )
+
     def test_post_edit(self):
         group = Group.objects.create(
             title="Тестовая группа 2",
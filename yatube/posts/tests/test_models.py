@@ -1,7 +1,20 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
 
-from ..models import Group, Post
+from .. import deletion
+from ..models import (
+    Comment, DeletionJob, Follow, Group, Post, TimelineEntry, UserStats
+)
 
 User = get_user_model()
 
@@ -27,3 +40,211 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         self.assertEqual(str(group), group.title)
         self.assertEqual(str(post), post.text[:15])
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='counters',
+            description='Тестовое описание',
+        )
+
+    def assertCounters(self, user, **expected):
+        stats = UserStats.objects.get(user=user)
+        for field, value in expected.items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении объектов"""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group
+        )
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertCounters(self.user, posts_count=1, followers_count=1)
+        self.assertCounters(
+            self.reader, comments_count=1, following_count=1
+        )
+        follow.delete()
+        post.delete()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertCounters(self.user, posts_count=0, followers_count=0)
+        self.assertCounters(
+            self.reader, comments_count=0, following_count=0
+        )
+
+    def test_post_group_change_moves_counter(self):
+        """Перенос поста в другую группу переносит счётчик"""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group
+        )
+        post.group = None
+        post.save()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+
+    def test_rebuild_counters_repairs_drift(self):
+        """rebuild_counters исправляет счётчики после bulk_create"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text='Пост', group=self.group)
+            for _ in range(3)
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 3)
+        self.assertCounters(self.user, posts_count=3)
+        self.assertCounters(self.reader, posts_count=0)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+# Файлы стираются после фиксации транзакции, поэтому без TestCase.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DeletionTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='leaving')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='leaving', description='Описание'
+        )
+        image = SimpleUploadedFile(
+            'leaving.gif',
+            b'\x47\x49\x46\x38\x39\x61\x01\x00\x01\x00\x00\x00\x00'
+            b'\x21\xf9\x04\x01\x00\x00\x00\x00\x2c\x00\x00\x00\x00'
+            b'\x01\x00\x01\x00\x00\x02\x02\x4c\x01\x00\x3b',
+            content_type='image/gif',
+        )
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.posts = [
+            Post.objects.create(
+                author=self.user, text=f'Пост {i}', group=self.group,
+                image=image if i == 0 else '',
+            ) for i in range(3)
+        ]
+        for post in self.posts:
+            Comment.objects.create(post=post, author=self.reader, text='Ок')
+        self.reader_post = Post.objects.create(
+            author=self.reader, text='Остаётся', group=self.group
+        )
+
+    def process(self):
+        call_command(
+            'process_deletions', batch=1, pause=0, stdout=StringIO()
+        )
+
+    def test_user_deleted_in_batches(self):
+        """Пользователь помечается, а удаляется с постами и файлами"""
+        image = self.posts[0].image.name
+        self.assertTrue(default_storage.exists(image))
+        deletion.schedule(self.user)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertTrue(self.user.stats.is_deleted)
+        self.assertTrue(DeletionJob.objects.exists())
+        self.client.force_login(self.reader)
+        for name in ('posts:index', 'posts:follow_index'):
+            page = self.client.get(reverse(name)).context['page_obj']
+            self.assertFalse(
+                any(post.author_id == self.user.pk for post in page)
+            )
+        self.process()
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Post.objects.filter(author=self.user).exists())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse(default_storage.exists(image))
+        self.assertFalse(DeletionJob.objects.exists())
+        stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(stats.comments_count, 0)
+        self.assertEqual(stats.following_count, 0)
+
+    def test_scheduled_user_pages_invalidated(self):
+        """Кеши главной и группы сбрасываются при пометке автора"""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', args=[self.group.slug]),
+        )
+        text = self.posts[-1].text
+        cache.clear()
+        for url in urls:
+            self.assertContains(self.client.get(url), text)
+        deletion.schedule(self.user)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.client.get(url), text)
+
+    def test_scheduled_user_posts_closed(self):
+        """Посты удаляемого автора закрыты для комментариев"""
+        post = self.posts[0]
+        deletion.schedule(self.user)
+        self.client.force_login(self.reader)
+        response = self.client.post(
+            reverse('posts:add_comment', args=[post.pk]), {'text': 'Ещё'}
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('posts:comments', args=[post.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_blocked_author_stays_visible(self):
+        """Заблокированный, но не удаляемый автор остаётся на сайте"""
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertIn(self.posts[0], response.context['page_obj'].object_list)
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:profile', args=[self.user.username])
+            ).status_code,
+            200,
+        )
+
+    def test_group_deleted_in_batches(self):
+        """Группа сразу скрыта, а посты остаются без группы"""
+        url = reverse('posts:group_posts', args=[self.group.slug])
+        deletion.schedule(self.group)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.process()
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists())
+        self.assertEqual(Post.objects.filter(group__isnull=True).count(), 4)
+
+    def test_post_hidden_until_deleted(self):
+        """Удаляемый пост пропадает с главной до фонового удаления"""
+        post = self.posts[1]
+        deletion.schedule(post)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn(post, response.context['page_obj'].object_list)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertNotIn(post, response.context['page_obj'].object_list)
+        self.client.force_login(self.user)
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:post_edit', args=[post.pk])
+            ).status_code,
+            404,
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse('posts:post_detail', args=[post.pk])
+            ).status_code,
+            404,
+        )
+        self.process()
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists())
@@ -0,0 +1,120 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from core.models import StoredFile
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def png(color):
+    content = io.BytesIO()
+    Image.new('RGB', (10, 10), color).save(content, 'PNG')
+    return content.getvalue()
+
+
+def hashed(content, extension):
+    digest = hashlib.sha256(content).hexdigest()
+    return f'posts/{digest[:2]}/{digest}{extension}'
+
+
+# Файлы стираются после фиксации транзакции, поэтому без TestCase.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentStorageTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='author')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def refs(self, name):
+        return StoredFile.objects.get(name=name).refs
+
+    def legacy(self, name, content):
+        path = os.path.join(TEMP_MEDIA_ROOT, 'posts', name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+        return Post.objects.create(
+            author=self.user, text=name, image='posts/' + name
+        )
+
+    def test_same_image_is_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом до последней ссылки"""
+        content = png('blue')
+        for text in ('Первый', 'Второй'):
+            self.client.post(reverse('posts:post_create'), {
+                'text': text,
+                'image': SimpleUploadedFile('meme.png', content),
+            })
+        first, second = Post.objects.order_by('pk')
+        name = first.image.name
+        self.assertEqual(name, hashed(content, '.png'))
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(self.refs(name), 2)
+        self.client.post(
+            reverse('posts:post_edit', args=[first.pk]), {
+                'text': 'Первый',
+                'image': SimpleUploadedFile('again.png', content),
+            }
+        )
+        self.assertEqual(self.refs(name), 2)
+        first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+        second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_dedupe_media(self):
+        """Старые файлы переименовываются по хешу, дубликаты удаляются"""
+        content = png('red')
+        first = self.legacy('a.png', content)
+        self.legacy('a.png', content)
+        copy = self.legacy('b.png', content)
+        other = self.legacy('c.png', png('green'))
+        output = StringIO()
+        call_command('dedupe_media', stdout=output)
+        name = hashed(content, '.png')
+        self.assertEqual(
+            set(Post.objects.values_list('image', flat=True)),
+            {name, hashed(png('green'), '.png')},
+        )
+        for post in (first, copy, other):
+            self.assertFalse(default_storage.exists(post.image.name))
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(self.refs(name), 3)
+        self.assertIn('Переименовано: 2, дубликатов удалено: 1', (
+            output.getvalue()
+        ))
+        self.assertNotIn('освобождено: 0', output.getvalue())
+
+    def test_normalize_images_moves_references(self):
+        """Нормализованный файл получает ссылки всех постов со старым"""
+        photo = io.BytesIO()
+        Image.new('RGB', (3000, 100), 'red').save(photo, 'JPEG')
+        first = self.legacy('photo.jpg', photo.getvalue())
+        self.legacy('photo.jpg', photo.getvalue())
+        call_command('normalize_images', stdout=StringIO())
+        name = Post.objects.values_list('image', flat=True).distinct().get()
+        self.assertRegex(name, r'^posts/\w\w/\w{64}\.jpg$')
+        self.assertEqual(self.refs(name), 2)
+        self.assertFalse(default_storage.exists(first.image.name))
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from ..models import Comment, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class TransferTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'dump.jsonl.gz')
+        self.author = User.objects.create_user('author', first_name='Лев')
+        self.reader = User.objects.create_user('reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.post = Post.objects.create(
+            author=self.author, group=self.group, text='Выгружаемый пост',
+            image='posts/picture.gif',
+        )
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_export_import_round_trip(self):
+        """Выгрузка загружается в пустую базу с теми же id и датами"""
+        call_command('export_yatube', self.path, stderr=StringIO())
+        pub_date = self.post.pub_date
+        media = os.path.join(self.directory, 'media')
+        os.makedirs(os.path.join(media, 'posts'))
+        with open(os.path.join(media, 'posts', 'picture.gif'), 'wb') as file:
+            file.write(b'GIF89a')
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command(
+            'import_yatube', self.path, media=media, stdout=StringIO()
+        )
+        post = Post.objects.select_related('author__stats').get(
+            pk=self.post.pk
+        )
+        self.assertEqual(post.text, 'Выгружаемый пост')
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.group.slug, 'group')
+        self.assertEqual(post.author.first_name, 'Лев')
+        self.assertEqual(post.author.stats.followers_count, 1)
+        self.assertEqual(post.comments_count, 1)
+        self.assertTrue(TimelineEntry.objects.filter(post=post).exists())
+        self.assertTrue(
+            os.path.exists(os.path.join(TEMP_MEDIA_ROOT, post.image.name))
+        )
+
+    def test_import_into_existing_data(self):
+        """Повторная загрузка сопоставляет людей и не дублирует подписки"""
+        call_command('export_yatube', self.path, stderr=StringIO())
+        call_command('import_yatube', self.path, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
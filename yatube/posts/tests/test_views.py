@@ -1,6 +1,9 @@
+import re
 import shutil
+from io import StringIO
 import tempfile
 import time
+from unittest import mock
 
 from django import forms
 from django.contrib.auth import get_user_model
@@ -9,8 +12,12 @@ from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
 
-from ..models import Group, Post, Follow
+from core import page_cache, thumbnails
+from core.models import ThumbnailJob
+from .. import cards, comments
+from ..models import Comment, Group, Post, Follow, TimelineEntry
 from ..forms import PostForm
 
 
@@ -18,6 +25,8 @@ User = get_user_model()
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+# Автор поста для условного GET, пост с автором и группой, комментарии.
+POST_DETAIL_QUERIES = 3
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -44,6 +53,7 @@ class PostViewsTest(TestCase):
             ) for i in range(12, 0, -1)
         ]
         Post.objects.bulk_create(posts)
+        call_command('rebuild_counters', stdout=StringIO())
         time.sleep(1E-6)
         small_gif = (
             b'\x47\x49\x46\x38\x39\x61\x02\x00'
@@ -156,6 +166,53 @@ class PostViewsTest(TestCase):
         )
         self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_index_cursor_pagination(self):
+        """Проверка переходов по курсорам index"""
+        response = self.guest_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertIsNone(second_page.next_cursor)
+        self.assertFalse(
+            set(first_page.object_list) & set(second_page.object_list)
+        )
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?cursor={second_page.previous_cursor}'
+        )
+        self.assertEqual(
+            response.context['page_obj'].object_list,
+            first_page.object_list
+        )
+
+    def test_cursor_page_methods_without_count(self):
+        """Методы страницы работают по курсорам и без COUNT(*)"""
+        response = self.guest_client.get(reverse('posts:index'))
+        first_page = response.context['page_obj']
+        response = self.guest_client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}'
+        )
+        second_page = response.context['page_obj']
+        with self.assertNumQueries(0):
+            self.assertTrue(first_page.has_next())
+            self.assertFalse(first_page.has_previous())
+            self.assertEqual(first_page.next_page_number(), 2)
+            self.assertEqual(first_page.end_index(), 10)
+            self.assertFalse(second_page.has_next())
+            self.assertTrue(second_page.has_previous())
+            self.assertTrue(second_page.has_other_pages())
+
+    def test_invalid_cursor_shows_first_page(self):
+        """Некорректный курсор открывает первую страницу"""
+        response = self.guest_client.get(
+            reverse('posts:index') + '?cursor=broken'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 10)
+
     def check_context_page(self, context):
         cache.clear()
         self.assertIn('page_obj', context)
@@ -262,21 +319,151 @@ class PostViewsTest(TestCase):
 
     def test_index_cache(self):
         """Проверка кеширования index"""
-        Post.objects.create(
+        post = Post.objects.create(
             author=self.user,
             text='test',
         )
-        post_count = Post.objects.count()
         response = self.guest_client.get('/')
         cached_response_content = response.content
-        Post.objects.first().delete()
+        Post.objects.filter(pk=post.pk).update(text='обновлено без сигнала')
         response = self.guest_client.get('/')
-        self.assertEqual(Post.objects.count(), post_count - 1)
         self.assertEqual(cached_response_content, response.content)
         cache.clear()
         response1 = self.guest_client.get('/')
         self.assertNotEqual(cached_response_content, response1.content)
 
+    def test_index_cache_invalidation(self):
+        """Изменение постов сбрасывает кеш index"""
+        post = Post.objects.create(
+            author=self.user,
+            text='test',
+        )
+        cached_response_content = self.guest_client.get('/').content
+        post.delete()
+        response = self.guest_client.get('/')
+        self.assertNotEqual(cached_response_content, response.content)
+        self.assertNotContains(response, f'/posts/{post.pk}/')
+
+    def test_index_cache_is_page_aware(self):
+        """Кеш index хранит каждую страницу отдельно"""
+        first_page = self.guest_client.get('/')
+        second_page = self.guest_client.get('/?page=2')
+        self.assertNotEqual(first_page.content, second_page.content)
+        self.assertContains(
+            second_page,
+            f'/posts/{second_page.context["page_obj"][0].pk}/'
+        )
+
+    def test_search(self):
+        """Поиск находит посты по индексу и следит за изменениями"""
+        post = Post.objects.create(author=self.user, text='Жирафы спят стоя')
+        url = reverse('posts:search')
+        response = self.guest_client.get(url, {'q': 'жираф'})
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertEqual(list(response.context['page_obj']), [post])
+        Post.objects.filter(pk=post.pk).update(text='Слоны спят стоя')
+        response = self.guest_client.get(url, {'q': 'жираф'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+        response = self.guest_client.get(url, {'q': 'тестовый "пост'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertContains(response, '?q=')
+
+    def test_search_ranks_all_matches(self):
+        """Старый релевантный пост выше новых, глубина - MAX_RESULTS"""
+        old_post = Post.objects.create(
+            author=self.user, text='Жирафы, жирафы и снова жирафы'
+        )
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Длинный пост {i}, где-то жираф')
+            for i in range(12)
+        )
+        url = reverse('posts:search')
+        with mock.patch('posts.search.MAX_RESULTS', 10):
+            response = self.guest_client.get(url, {'q': 'жираф'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0], old_post)
+        self.assertEqual(len(page_obj), 10)
+        self.assertIsNone(page_obj.next_cursor)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через индекс FTS5"""
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'картинкой'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].queryset), [self.post]
+        )
+
+    def test_conditional_get(self):
+        """Неизменённая страница отвечает 304 без рендеринга"""
+        urls = (
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}),
+        )
+        etags = {}
+        for url in urls:
+            with self.subTest(url=url):
+                etag = etags[url] = self.guest_client.get(url)['ETag']
+                with self.assertNumQueries(1):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag
+                    )
+                self.assertEqual(response.status_code, 304)
+                response = self.author_post.get(
+                    url, HTTP_IF_NONE_MATCH=etag
+                )
+                self.assertEqual(response.status_code, 200)
+        Comment.objects.create(post=self.post, author=self.user, text='Да')
+        Post.objects.create(author=self.user, text='Новый', group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_anonymous_page_cache(self):
+        """Анонимные страницы отдаются из кеша и сбрасываются по тегам"""
+        url = reverse('posts:group_posts', kwargs={'slug': self.group.slug})
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        response = self.author_post.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'bypass')
+        Post.objects.create(author=self.user, text='Свежий', group=self.group)
+        key = page_cache.page_key(response.wsgi_request)
+        cache.add(page_cache.lock_key(key), 1)
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+        self.assertNotContains(response, 'Свежий')
+        cache.delete(page_cache.lock_key(key))
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Свежий')
+
+    def test_post_cards_are_shared_between_feeds(self):
+        """Карточка рендерится один раз на все ленты до изменения поста"""
+        group_url = reverse('posts:group_posts', kwargs={'slug': 'test-slug'})
+        profile_url = reverse('posts:profile', kwargs={'username': 'auth'})
+        with mock.patch(
+            'posts.cards.render_card', wraps=cards.render_card
+        ) as render_card:
+            self.authorized_client.get(group_url)
+            self.assertEqual(render_card.call_count, 1)
+            self.authorized_client.get(profile_url)
+            self.assertEqual(render_card.call_count, 10)
+            post = Post.objects.get(pk=self.post.pk)
+            post.text = 'Отредактированный пост'
+            post.save()
+            response = self.authorized_client.get(group_url)
+            self.assertEqual(render_card.call_count, 11)
+        self.assertContains(response, 'Отредактированный пост')
+
     def test_follow_and_unfollow(self):
         """Проверка подписки и отмены подписки"""
         no_follows = Follow.objects.all().count()
@@ -303,3 +490,147 @@ class PostViewsTest(TestCase):
         self.assertContains(response, 'Тестовый пост c картинкой')
         response = self.author_post.get('/follow/')
         self.assertNotContains(response, 'Тестовый пост c картинкой')
+
+    def test_follow_timeline_fan_out(self):
+        """Подписка заполняет ленту, пост раскладывается, отписка чистит"""
+        self.authorized_client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': 'auth'}
+        ))
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(),
+            self.count_of_posts
+        )
+        new_post = Post.objects.create(author=PostViewsTest.user, text='new')
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.user, post=new_post
+            ).exists()
+        )
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': 'auth'}
+        ))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.user).exists())
+
+    def test_follow_timeline_merges_heavy_authors(self):
+        """Посты авторов без разветвления подмешиваются при чтении"""
+        with mock.patch('posts.timeline.FANOUT_LIMIT', 0):
+            self.authorized_client.get(reverse(
+                'posts:profile_follow',
+                kwargs={'username': 'auth'}
+            ))
+            self.assertFalse(
+                TimelineEntry.objects.filter(user=self.user).exists()
+            )
+            response = self.authorized_client.get(reverse(
+                'posts:follow_index'
+            ))
+            first_page = response.context['page_obj']
+            self.assertEqual(first_page[0], PostViewsTest.post)
+            response = self.authorized_client.get(
+                reverse('posts:follow_index')
+                + f'?cursor={first_page.next_cursor}'
+            )
+        self.assertEqual(
+            len(first_page) + len(response.context['page_obj']),
+            self.count_of_posts
+        )
+
+    def test_follow_timeline_heavy_author_becomes_light(self):
+        """После отписки автор без разветвления раскладывается по лентам"""
+        other = User.objects.create_user(username='other_follower')
+        with mock.patch('posts.timeline.FANOUT_LIMIT', 1):
+            Follow.objects.create(user=self.user, author=PostViewsTest.user)
+            Follow.objects.create(user=other, author=PostViewsTest.user)
+            new_post = Post.objects.create(
+                author=PostViewsTest.user, text='Пост тяжёлого автора'
+            )
+            self.assertFalse(
+                TimelineEntry.objects.filter(post=new_post).exists()
+            )
+            Follow.objects.filter(user=other).delete()
+            self.assertEqual(
+                TimelineEntry.objects.filter(user=self.user).count(),
+                self.count_of_posts + 1
+            )
+            response = self.authorized_client.get(reverse(
+                'posts:follow_index'
+            ))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+
+    def test_post_detail_query_count(self):
+        """Число запросов post_detail не зависит от числа комментариев"""
+        post = Post.objects.create(author=self.user, text='Обсуждаемый пост')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.id})
+        for comments_count in (1, 30):
+            Comment.objects.bulk_create(
+                Comment(
+                    post=post,
+                    author=User.objects.create_user(
+                        username=f'commentator_{comments_count}_{i}'
+                    ),
+                    text=f'Комментарий {i}',
+                ) for i in range(comments_count)
+            )
+            cache.clear()
+            with self.subTest(comments_count=comments_count):
+                with self.assertNumQueries(POST_DETAIL_QUERIES):
+                    self.guest_client.get(url)
+
+    def test_post_detail_comments_pagination(self):
+        """Комментарии грузятся страницами, первая - из кеша"""
+        post = Post.objects.create(author=self.user, text='Вирусный пост')
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.user, text=f'Комментарий №{i}')
+            for i in range(comments.PER_PAGE + 5)
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.id})
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Комментарий №', comments.PER_PAGE)
+        self.assertContains(response, 'comments-more')
+        more = re.search(
+            r'href="([^"]+)"\s*>\s*Показать ещё', response.content.decode()
+        ).group(1)
+        fragment = self.authorized_client.get(
+            more, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertContains(fragment, 'Комментарий №', 5)
+        self.assertNotContains(fragment, '<html')
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            {'text': 'Свежий комментарий'},
+        )
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Свежий комментарий')
+        Post.objects.filter(pk=post.pk).update(is_deleted=True)
+        fragment = self.authorized_client.get(
+            more, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(fragment.status_code, 404)
+
+    def test_thumbnail_generated_by_worker(self):
+        """До генерации миниатюры показывается исходник, после - миниатюра"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        self.assertTrue(
+            ThumbnailJob.objects.filter(source=self.post.image.name).exists()
+        )
+        self.assertContains(self.guest_client.get(url), self.post.image.url)
+        call_command('process_thumbnails', stdout=StringIO())
+        self.assertFalse(ThumbnailJob.objects.exists())
+        response = self.guest_client.get(url)
+        self.assertNotContains(response, self.post.image.url)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+
+    def test_thumbnail_variants_in_srcset(self):
+        """Карточка отдаёт все ширины в srcset и грузится лениво"""
+        call_command('process_thumbnails', stdout=StringIO())
+        response = self.guest_client.get(reverse('posts:index'))
+        for width in thumbnails.WIDTHS:
+            self.assertContains(response, f' {width}w')
+        self.assertContains(response, 'loading="lazy"')
+        detail = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        )
+        self.assertContains(detail, 'srcset=')
+        self.assertNotContains(detail, 'loading="lazy"')
@@ -0,0 +1,174 @@
+"""Лента подписок с разветвлением при записи (fan-out-on-write).
+
+Новый пост копируется в ``TimelineEntry`` каждого подписчика, и чтение
+ленты превращается в один проход по индексу ``(user, pub_date)``.
+Авторы, у которых подписчиков больше ``TIMELINE_FANOUT_LIMIT``, в ленты
+не раскладываются: их посты подмешиваются при чтении.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from core.paginator import CursorPaginator, NEXT
+from .models import Follow, Post, TimelineEntry
+
+FANOUT_LIMIT = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+BATCH_SIZE = getattr(settings, 'TIMELINE_BATCH_SIZE', 500)
+
+REBUILD_SQL = '''
+INSERT INTO posts_timelineentry (user_id, post_id, pub_date)
+SELECT DISTINCT posts_follow.user_id, posts_post.id, posts_post.pub_date
+FROM posts_follow
+INNER JOIN posts_post ON posts_post.author_id = posts_follow.author_id
+WHERE posts_follow.author_id NOT IN (
+    SELECT author_id FROM posts_follow
+    GROUP BY author_id HAVING COUNT(*) > %s
+)
+'''
+
+
+def is_heavy(author_id):
+    followers = Follow.objects.filter(author_id=author_id)
+    return followers[FANOUT_LIMIT:FANOUT_LIMIT + 1].exists()
+
+
+def heavy_author_ids(user):
+    """Авторы из подписок пользователя, посты которых не раскладываются.
+
+    Читает счётчик подписчиков из ``UserStats``, а не считает подписки:
+    сигналы меняют его в той же транзакции, что и саму подписку.
+    """
+    return list(
+        Follow.objects
+        .filter(user=user, author__stats__followers_count__gt=FANOUT_LIMIT)
+        .values_list('author_id', flat=True)
+    )
+
+
+def write_entries(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out(post):
+    if is_heavy(post.author_id):
+        return
+    follower_ids = (
+        Follow.objects.filter(author_id=post.author_id)
+        .values_list('user_id', flat=True)
+        .distinct()
+    )
+    write_entries(
+        TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+        for user_id in follower_ids.iterator()
+    )
+
+
+def became_light(author_id):
+    """Подписчиков ровно FANOUT_LIMIT: отписка перевела автора в лёгкие."""
+    followers = Follow.objects.filter(author_id=author_id)
+    return followers[:FANOUT_LIMIT + 1].count() == FANOUT_LIMIT
+
+
+def backfill_followers(author_id):
+    """Раскладывает все посты автора по лентам всех его подписчиков.
+
+    Пока автор был «тяжёлым», его посты в ленты не попадали, а после
+    перехода в лёгкие лента читает только ``TimelineEntry``.
+    """
+    posts = list(
+        Post.objects.filter(author_id=author_id)
+        .values_list('pk', 'pub_date')
+    )
+    follower_ids = (
+        Follow.objects.filter(author_id=author_id)
+        .values_list('user_id', flat=True)
+        .order_by()
+        .distinct()
+    )
+    write_entries(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for user_id in follower_ids.iterator()
+        for pk, pub_date in posts
+    )
+
+
+def backfill(user_id, author_id):
+    if is_heavy(author_id):
+        return
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .values_list('pk', 'pub_date')
+    )
+    write_entries(
+        TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+def prune(user_id, author_id):
+    still_following = Follow.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).exists()
+    if not still_following:
+        TimelineEntry.objects.filter(
+            user_id=user_id, post__author_id=author_id
+        ).delete()
+    if became_light(author_id):
+        backfill_followers(author_id)
+
+
+def rebuild():
+    """Заново раскладывает все ленты, например после массовой загрузки."""
+    with transaction.atomic():
+        TimelineEntry.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(REBUILD_SQL, [FANOUT_LIMIT])
+
+
+class TimelinePaginator(CursorPaginator):
+    """Постраничное чтение ленты подписок пользователя.
+
+    Страница собирается слиянием двух отсортированных потоков: записей
+    ``TimelineEntry`` и постов «тяжёлых» авторов. Курсоры совместимы с
+    остальными лентами - это пара ``(pub_date, id поста)``.
+    """
+
+    def __init__(self, user, per_page):
+        # Записи удаляемых постов и авторов остаются в лентах, пока их
+        # не сотрёт process_deletions.
+        super().__init__(
+            TimelineEntry.objects.filter(
+                user=user, post__is_deleted=False,
+            ).exclude(post__author__stats__is_deleted=True),
+            per_page, pk_field='post_id',
+        )
+        heavy = heavy_author_ids(user)
+        self.merged_posts = None
+        if heavy:
+            self.merged_posts = Post.objects.filter(
+                author_id__in=heavy, is_deleted=False,
+            ).exclude(
+                author__stats__is_deleted=True
+            ).order_by('-pub_date', '-pk')
+
+    def fetch(self, direction=NEXT, position=None, offset=0):
+        stop = offset + self.per_page + 1
+        keys = self.slice(
+            self.object_list.values_list('pub_date', 'post_id'),
+            direction, position, 0, stop,
+        )
+        if self.merged_posts is not None:
+            keys += self.slice(
+                self.merged_posts.values_list('pub_date', 'pk'),
+                direction, position, 0, stop, pk_field='pk',
+            )
+            keys = sorted(set(keys), reverse=direction == NEXT)[:stop]
+        keys = keys[offset:]
+        posts = Post.objects.select_related('author', 'group').in_bulk(
+            [pk for _, pk in keys]
+        )
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def position(self, post):
+        return post.pub_date, post.pk
@@ -0,0 +1,255 @@
+"""Выгрузка и загрузка данных yatube в формате JSON Lines.
+
+Каждая строка - одна запись ``{"model": ..., "pk": ..., "fields": {...}}``.
+Модели идут в порядке зависимостей: пользователи, группы, посты,
+комментарии, подписки, поэтому загрузка переназначает внешние ключи
+на лету, не читая файл дважды.
+
+Пользователи и группы сопоставляются с существующими по username и slug.
+Посты сохраняют свои id, сдвинутые на максимальный id в базе: в пустую
+базу они попадают с теми же id и адресами, а для сопоставления не
+нужен словарь на каждый пост. Сигналы при ``bulk_create`` не работают,
+поэтому счётчики и ленты подписок пересчитываются в конце.
+"""
+import gzip
+import json
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from core.storage import content_storage
+from . import counters, timeline
+from .models import Comment, Follow, Group, Post, User
+
+CHUNK_SIZE = 2000
+BATCH_SIZE = 5000
+REPORT_EVERY = 100000
+# Уровень 9 по умолчанию тратит на сжатие больше, чем на всю выгрузку.
+GZIP_LEVEL = 3
+
+SPECS = (
+    ('user', User, (
+        'username', 'first_name', 'last_name', 'email', 'password',
+        'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login',
+    )),
+    ('group', Group, ('title', 'slug', 'description')),
+    ('post', Post, (
+        'text', 'pub_date', 'updated_at', 'author', 'group', 'image',
+        'image_width', 'image_height', 'image_size', 'image_placeholder',
+    )),
+    ('comment', Comment, ('post', 'author', 'text', 'created')),
+    ('follow', Follow, ('user', 'author')),
+)
+DATE_FIELDS = {
+    'date_joined', 'last_login', 'pub_date', 'updated_at', 'created',
+}
+
+
+def open_dump(path, mode):
+    """Файл выгрузки; ``-`` - stdin/stdout, ``.gz`` - сжатие gzip."""
+    if path == '-':
+        return sys.stdout if 'w' in mode else sys.stdin
+    if path.endswith('.gz'):
+        return gzip.open(
+            path, mode + 't', compresslevel=GZIP_LEVEL, encoding='utf-8'
+        )
+    return open(path, mode, encoding='utf-8')
+
+
+class Progress:
+    def __init__(self, write, every=REPORT_EVERY):
+        self.write = write
+        self.every = every
+        self.counts = Counter()
+        self.started = time.monotonic()
+
+    def add(self, label, count=1):
+        before = self.counts[label]
+        self.counts[label] += count
+        if self.counts[label] // self.every > before // self.every:
+            self.report(label)
+
+    def finish(self, label):
+        if self.counts[label] % self.every:
+            self.report(label)
+
+    def report(self, label):
+        elapsed = time.monotonic() - self.started
+        rate = sum(self.counts.values()) / elapsed if elapsed else 0
+        self.write(f'{label}: {self.counts[label]} ({rate:.0f} строк/с)')
+
+
+def encode_date(value):
+    # DjangoJSONEncoder округляет до миллисекунд, а по дате с id
+    # строятся курсоры лент.
+    return value.isoformat()
+
+
+def export(stream, progress, chunk_size=CHUNK_SIZE):
+    """Пишет все данные в stream; память не растёт с объёмом базы."""
+    for label, model, fields in SPECS:
+        rows = model.objects.order_by('pk').values_list('pk', *fields)
+        for row in rows.iterator(chunk_size=chunk_size):
+            stream.write(json.dumps({
+                'model': label,
+                'pk': row[0],
+                'fields': dict(zip(fields, row[1:])),
+            }, default=encode_date, ensure_ascii=False) + '\n')
+            progress.add(label)
+        progress.finish(label)
+
+
+@contextmanager
+def explicit_dates():
+    """Отключает auto_now и auto_now_add, чтобы сохранить даты выгрузки.
+
+    Меняет поля моделей на уровне процесса - только для команд.
+    """
+    fields = [
+        Post._meta.get_field('pub_date'),
+        Post._meta.get_field('updated_at'),
+        Comment._meta.get_field('created'),
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def read_records(lines):
+    for line in lines:
+        if line.strip():
+            record = json.loads(line)
+            fields = record['fields']
+            for name in DATE_FIELDS.intersection(fields):
+                if fields[name]:
+                    fields[name] = parse_datetime(fields[name])
+            yield record
+
+
+def batches(records, size):
+    """Пачки подряд идущих записей одной модели."""
+    for label, group in groupby(records, key=lambda r: r['model']):
+        while True:
+            batch = list(islice(group, size))
+            if not batch:
+                break
+            yield label, batch
+
+
+class Importer:
+    def __init__(self, progress, batch_size=BATCH_SIZE, media_root=None):
+        self.progress = progress
+        self.batch_size = batch_size
+        self.media_root = media_root
+        self.users = {}
+        self.groups = {}
+        # Пропущенные посты нужны, чтобы пропустить и их комментарии.
+        self.skipped_posts = set()
+        self.skipped = Counter()
+        # {имя в выгрузке: имя в хранилище}: файл копируется один раз.
+        self.media = {}
+        self.post_offset = (
+            Post.objects.aggregate(last=Max('pk'))['last'] or 0
+        )
+
+    def run(self, lines):
+        with explicit_dates():
+            for label, batch in batches(read_records(lines), self.batch_size):
+                with transaction.atomic():
+                    getattr(self, f'import_{label}')(batch)
+                self.progress.add(label, len(batch))
+        for label in self.progress.counts:
+            self.progress.finish(label)
+        counters.rebuild()
+        timeline.rebuild()
+
+    def match(self, model, field, records):
+        """Создаёт недостающие объекты и возвращает {старый pk: новый}."""
+        by_key = {r['fields'][field]: r for r in records}
+        existing = set(model.objects.filter(
+            **{f'{field}__in': list(by_key)}
+        ).values_list(field, flat=True))
+        model.objects.bulk_create(
+            (model(**r['fields']) for key, r in by_key.items()
+             if key not in existing),
+            ignore_conflicts=True,
+        )
+        pks = model.objects.filter(
+            **{f'{field}__in': list(by_key)}
+        ).values_list(field, 'pk')
+        return {by_key[key]['pk']: pk for key, pk in pks}
+
+    def import_user(self, records):
+        self.users.update(self.match(User, 'username', records))
+
+    def import_group(self, records):
+        self.groups.update(self.match(Group, 'slug', records))
+
+    def import_post(self, records):
+        posts = []
+        for record in records:
+            fields = record['fields']
+            author = self.users.get(fields.pop('author'))
+            if author is None:
+                self.skipped['post'] += 1
+                self.skipped_posts.add(record['pk'])
+                continue
+            fields['author_id'] = author
+            fields['group_id'] = self.groups.get(fields.pop('group'))
+            if fields['image'] and self.media_root:
+                fields['image'] = self.copy_media(fields['image'])
+            posts.append(Post(pk=record['pk'] + self.post_offset, **fields))
+        Post.objects.bulk_create(posts)
+
+    def import_comment(self, records):
+        comments = []
+        for record in records:
+            fields = record['fields']
+            author = self.users.get(fields.pop('author'))
+            post = fields.pop('post')
+            if author is None or post in self.skipped_posts:
+                self.skipped['comment'] += 1
+                continue
+            comments.append(Comment(
+                author_id=author, post_id=post + self.post_offset, **fields
+            ))
+        Comment.objects.bulk_create(comments)
+
+    def import_follow(self, records):
+        follows = []
+        for record in records:
+            user = self.users.get(record['fields']['user'])
+            author = self.users.get(record['fields']['author'])
+            if user is None or author is None:
+                self.skipped['follow'] += 1
+                continue
+            follows.append(Follow(user_id=user, author_id=author))
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+    def copy_media(self, name):
+        """Копирует файл в хранилище и возвращает его новое имя.
+
+        Хранилище называет файлы по хешу содержимого, так что повторная
+        загрузка выгрузки не создаёт копий. Ссылки на файлы
+        пересчитываются вместе со счётчиками в конце загрузки.
+        """
+        if name not in self.media:
+            source = os.path.join(self.media_root, name)
+            if not os.path.exists(source):
+                return name
+            with open(source, 'rb') as file:
+                self.media[name] = content_storage.save(name, file)
+        return self.media[name]
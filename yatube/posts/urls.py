@@ -20,6 +20,10 @@ urlpatterns = [
          views.post_detail,
          name='post_detail'
          ),
+    path('search/',
+         views.search,
+         name='search'
+         ),
     path('create/',
          views.post_create,
          name='post_create'
@@ -28,6 +32,10 @@ urlpatterns = [
          views.post_edit,
          name='post_edit'
          ),
+    path('posts/<int:post_id>/comments/',
+         views.comments,
+         name='comments'
+         ),
     path('posts/<int:post_id>/comment/',
          views.add_comment,
          name='add_comment'
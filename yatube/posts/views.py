@@ -1,36 +1,77 @@
 from datetime import date
 
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
 from django.contrib.auth.decorators import login_required
-from datetime import date
+from django.http import HttpResponse
 
+from core.cache import get_version
+from core.conditional import conditional_page
+from core.page_cache import cache_anonymous_page
+from core.paginator import CursorPaginator
+from core.routers import replica_reads
+from . import comments as comment_pages
+from .counters import get_stats
 from .forms import PostForm, CommentForm
 from .models import Post, Group, User, Follow
+from .search import SearchPaginator, search as search_posts
+from .signals import (
+    AUTHOR_PAGE, FEED_PAGE, FEED_VERSION, GROUP_PAGE, post_pages
+)
+from .timeline import TimelinePaginator
 
 ENTRIES = 10
 
 
+def visible(posts):
+    """Посты без удаляемых: помеченных и принадлежащих удаляемым авторам."""
+    return posts.filter(is_deleted=False).exclude(
+        author__stats__is_deleted=True
+    )
+
+
+def get_page_obj(request, posts):
+    paginator = CursorPaginator(posts, ENTRIES)
+    return paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
+
+
+def feed_page(request):
+    return [FEED_PAGE]
+
+
+@cache_anonymous_page(feed_page)
+@replica_reads
 def index(request):
-    posts = Post.objects.select_related().all()
-    paginator = Paginator(posts, ENTRIES)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = visible(Post.objects).select_related('author', 'group')
+    page_obj = get_page_obj(request, posts)
     title = 'Последние обновления на сайте'
     context = {
         'page_obj': page_obj,
         'title': title,
+        'feed_version': get_version(FEED_VERSION),
     }
     template = 'posts/index.html'
     return render(request, template, context)
 
 
+def group_page(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug, is_deleted=False
+    ).values_list(
+        'pk', flat=True
+    ).first()
+    return group_id and [GROUP_PAGE.format(group_id)]
+
+
+@conditional_page(group_page)
+@cache_anonymous_page(group_page)
+@replica_reads
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.select_related('group')
-    paginator = Paginator(posts, ENTRIES)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = get_object_or_404(Group, slug=slug, is_deleted=False)
+    posts = visible(group.posts).select_related('author', 'group')
+    page_obj = get_page_obj(request, posts)
     title = 'Записи сообщества ' + str(group)
     context = {
         'group': group,
@@ -41,12 +82,27 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+def profile_page(request, username):
+    author_id = User.objects.filter(username=username).exclude(
+        stats__is_deleted=True
+    ).values_list(
+        'pk', flat=True
+    ).first()
+    return author_id and [AUTHOR_PAGE.format(author_id)]
+
+
+@conditional_page(profile_page)
+@cache_anonymous_page(profile_page)
+@replica_reads
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.select_related('author')
-    paginator = Paginator(posts, ENTRIES)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats').exclude(stats__is_deleted=True),
+        username=username
+    )
+    posts = author.posts.filter(is_deleted=False).select_related(
+        'author', 'group'
+    )
+    page_obj = get_page_obj(request, posts)
     following = Follow.objects.filter(
         author=author.id,
         user=request.user.id
@@ -56,17 +112,47 @@ def profile(request, username):
         'page_obj': page_obj,
         'title': title,
         'author': author,
+        'stats': get_stats(author),
         'following': following,
     }
     template = 'posts/profile.html'
     return render(request, template, context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = visible(search_posts(query)).select_related('author', 'group')
+    page_obj = SearchPaginator(posts, ENTRIES).get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
+    title = 'Поиск: ' + query if query else 'Поиск'
+    context = {
+        'page_obj': page_obj,
+        'title': title,
+        'query': query,
+    }
+    template = 'posts/search.html'
+    return render(request, template, context)
+
+
+def post_page(request, post_id):
+    author_id = visible(Post.objects.filter(pk=post_id)).values_list(
+        'author_id', flat=True
+    ).first()
+    return author_id and post_pages(post_id, author_id)
+
+
+@conditional_page(post_page)
+@cache_anonymous_page(post_page)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    posts_count = post.author.posts.count()
+    post = get_object_or_404(
+        visible(Post.objects.select_related('author__stats', 'group')),
+        id=post_id
+    )
+    posts_count = get_stats(post.author).posts_count
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = comment_pages.first_page(post.pk)
     context = {
         'post': post,
         'posts_count': posts_count,
@@ -98,7 +184,7 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(visible(Post.objects), pk=post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
@@ -118,9 +204,23 @@ def post_edit(request, post_id):
     return render(request, template, context)
 
 
+def comments(request, post_id):
+    get_object_or_404(visible(Post.objects), pk=post_id)
+    cursor = request.GET.get('cursor')
+    if request.is_ajax():
+        return HttpResponse(
+            comment_pages.render_page(post_id, cursor)
+        )
+    context = {
+        'comments': comment_pages.get_page(post_id, cursor),
+        'post_id': post_id,
+    }
+    return render(request, 'posts/comments.html', context)
+
+
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(visible(Post.objects), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -131,11 +231,13 @@ def add_comment(request, post_id):
 
 
 @login_required
+@replica_reads
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, ENTRIES)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = TimelinePaginator(request.user, ENTRIES)
+    page_obj = paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
     context = {
         'page_obj': page_obj,
     }
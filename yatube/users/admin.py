@@ -1,3 +1,15 @@
-# from django.contrib import admin
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
 
-# Register your models here.
+from posts.admin import BackgroundDeleteMixin
+
+User = get_user_model()
+
+
+class YatubeUserAdmin(BackgroundDeleteMixin, UserAdmin):
+    pass
+
+
+admin.site.unregister(User)
+admin.site.register(User, YatubeUserAdmin)
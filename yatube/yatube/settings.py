@@ -50,11 +50,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -92,6 +94,44 @@ DATABASES = {
     }
 }
 
+# Профиль базы данных: development - настройки SQLite по умолчанию,
+# production - журнал WAL, PRAGMA из SQLITE_PRODUCTION_PRAGMAS на каждом
+# соединении и переиспользование соединений между запросами.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'development')
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # С WAL синхронизация на диск нужна только при checkpoint.
+    'synchronous': 'NORMAL',
+    # Отрицательное значение - размер в КиБ, а не в страницах.
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Сколько миллисекунд ждать чужую запись, прежде чем вернуть
+    # «database is locked».
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+SQLITE_PRAGMAS = {}
+
+# Реплика только для чтения: копия основной базы в файле из переменной
+# DATABASE_REPLICA, которую обновляет manage.py sync_replica. Ленты
+# читаются с неё; после POST клиент REPLICA_STICKY_SECONDS читает с
+# основной базы, чтобы видеть свои изменения.
+DATABASE_REPLICAS = []
+if os.environ.get('DATABASE_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DATABASE_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = 10
+
+if DATABASE_PROFILE == 'production':
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = 600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -132,6 +172,13 @@ USE_TZ = True
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+# collectstatic добавляет в имена хеш содержимого и сжимает текстовые
+# файлы в .gz и .br; core.staticfiles раздаёт их с вечным кешем.
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+STATIC_SERVE = os.environ.get('STATIC_SERVE', '1') == '1'
+STATIC_MAX_AGE = 60 * 60
+STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -142,9 +189,79 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загруженные файлы раздаёт core.media: с Range, ETag и вечным кешем
+# для имён по хешу. Сам файл можно отдать фронтенд-серверу: nginx -
+# префиксом внутреннего location в MEDIA_ACCEL_REDIRECT, Apache и
+# lighttpd - через MEDIA_SENDFILE.
+MEDIA_SERVE = os.environ.get('MEDIA_SERVE', '1') == '1'
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') == '1'
+MEDIA_MAX_AGE = 60 * 60
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Загрузки пишутся сразу во временный файл, а не в память процесса.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Загруженные картинки уменьшаются до IMAGE_MAX_SIZE пикселей по
+# большей стороне и перекодируются без EXIF (core.images).
+IMAGE_MAX_SIZE = 2048
+IMAGE_MAX_BYTES = 512 * 1024
+IMAGE_QUALITY = 85
+IMAGE_MAX_ANIMATED_BYTES = 4 * 1024 * 1024
+IMAGE_PLACEHOLDER_SIZE = 16
+
+# Варианты миниатюр для srcset: ширины и форматы в порядке
+# предпочтения, последний - запасной. Форматы, которые не умеет
+# кодировать установленный Pillow, пропускаются.
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_FORMATS = ('WEBP', 'JPEG')
+THUMBNAIL_SIZES = '(min-width: 992px) 960px, 100vw'
+
+# Двухуровневый кеш: маленький LRU в памяти процесса перед общим для всех
+# воркеров файлом SQLite, который переживает перезапуск.
+CACHE_LOCATION = os.environ.get(
+    'CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+)
+# Тесты подменяют файл на временный (core.testing).
+TEST_RUNNER = 'core.testing.TestRunner'
+CACHE_SHARED_TIMEOUT = 60 * 60 * 24
+CACHE_SHARED_MAX_ENTRIES = 100000
+CACHE_LOCAL_TIMEOUT = 5
+CACHE_LOCAL_MAX_ENTRIES = 1000
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache_backends.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': CACHE_LOCAL_TIMEOUT,
+            'LOCAL_MAX_ENTRIES': CACHE_LOCAL_MAX_ENTRIES,
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': CACHE_LOCATION,
+        'TIMEOUT': CACHE_SHARED_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': CACHE_SHARED_MAX_ENTRIES,
+        },
+    },
+}
+
+# Метрики запросов: заголовок Server-Timing, JSON-строка в лог на каждый
+# запрос и окно последних замеров для /admin/metrics/.
+METRICS_SERVER_TIMING = True
+METRICS_LOG = os.environ.get('METRICS_LOG') == '1'
+METRICS_WINDOW = 1000
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.metrics': {'handlers': ['console'], 'level': 'INFO'},
+    },
 }
@@ -16,20 +16,29 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from core.views import media, metrics, static
 
 
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
+    path('admin/metrics/', metrics, name='metrics'),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls', namespace='auth')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
+if settings.STATIC_SERVE:
+    urlpatterns.append(
+        path(settings.STATIC_URL.lstrip('/') + '<path:path>', static,
+             name='static')
+    )
+
+if settings.MEDIA_SERVE:
+    urlpatterns.append(
+        path(settings.MEDIA_URL.lstrip('/') + '<path:path>', media,
+             name='media')
     )
 
 handler404 = 'core.views.page_not_found'